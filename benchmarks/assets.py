@@ -0,0 +1,66 @@
+"""
+Asset matching benchmark.
+Classifies the release assets of the corpus and chooses the asset of every tool for every platform,
+reporting the number of releases that are matched per second.
+
+    python3 -m benchmarks.assets --runs 1000
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from mercado.assets import AssetIndex, classify_asset
+from mercado.utils import get_architecture_variations
+
+CORPUS = Path(__file__).parent / "data" / "assets.json"
+PLATFORMS = [(os, arch) for os in ("linux", "darwin") for arch in ("amd64", "arm64")]
+
+
+def select_all(corpus: dict) -> int:
+    selected = 0
+    for release in corpus.values():
+        index = AssetIndex([classify_asset(name, name) for name in release["assets"]])
+        for os, arch in PLATFORMS:
+            templates = []
+            if template := release.get("template"):
+                templates = [template.format(os=os, arch=variation) for variation in get_architecture_variations(arch)]
+            selected += bool(index.select(release["tool"], os, arch, templates))
+    return selected
+
+
+def run(runs: int) -> dict:
+    corpus = json.loads(CORPUS.read_text())
+
+    # The first pass parses every asset name, the following ones reuse the classification
+    start = time.perf_counter()
+    selected = select_all(corpus)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        select_all(corpus)
+    warm = (time.perf_counter() - start) / runs
+
+    return {
+        "benchmark": "assets",
+        "releases": len(corpus),
+        "assets": sum(len(release["assets"]) for release in corpus.values()),
+        "selected": selected,
+        "runs": runs,
+        "cold_ms": round(cold * 1000, 3),
+        "releases_per_sec": round(len(corpus) / warm),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.runs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+CLI benchmark.
+Runs mercado commands as fresh processes against the local stand-ins of the release APIs (benchmarks/fake_server.py),
+every run starts from an empty home directory, so nothing is installed or cached unless the scenario sets it up:
+
+    cold_start          mercado --help, without any network
+    list_verbose_cold   list --verbose with INSTALLED tools installed and an empty cache
+    list_verbose_warm   list --verbose with INSTALLED tools installed and a populated cache
+    install_single      install gh
+    install_multi       install INSTALLED with --jobs 4
+
+The results are printed and written as JSON with the commit they were measured on,
+two result files are compared with benchmarks.compare.
+
+    python3 -m benchmarks.cli --runs 5 --size 8 --latency 0.02 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable
+
+from benchmarks.fake_server import ARCHIVE_FORMATS, FakeServer
+
+ROOT = Path(__file__).parent.parent
+MB = 1024 * 1024
+INSTALLED = ["gh", "k9s", "kind", "terraform", "vault"]
+
+
+class Runner:
+    def __init__(self, server: FakeServer, token: bool):
+        self.server = server
+        self.token = token
+
+    def mercado(self, home: Path, *args: str, routed: bool = True) -> float:
+        """Run mercado in a fresh process within the home directory, returns how long it took"""
+        env = {
+            key: value
+            for key, value in os.environ.items()
+            if not key.startswith("MERCADO_") and key not in ("GITHUB_TOKEN", "DOCKER_CONFIG")
+        }
+        env |= {
+            "HOME": str(home),
+            "PATH": f"{home / '.mercado'}{os.pathsep}{os.environ['PATH']}",
+            "LOGLEVEL": "ERROR",
+            "MERCADO_FAKE_SERVER_URL": self.server.url,
+        }
+        if self.token:
+            # Authenticated requests resolve the latest versions of GitHub tools with a single GraphQL query
+            env["GITHUB_TOKEN"] = "fake"
+
+        entrypoint = ["-m", "benchmarks.routed"] if routed else [str(ROOT / "main.py")]
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *entrypoint, *args],
+            env=env,
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return time.perf_counter() - start
+
+    def measure(self, runs: int, run: Callable[[Path], float], setup: Callable[[Path], None] | None = None) -> dict:
+        durations = []
+        for _ in range(runs):
+            with TemporaryDirectory(prefix="mercado-bench-") as home:
+                if setup:
+                    setup(Path(home))
+                durations.append(run(Path(home)))
+
+        return {
+            "runs": runs,
+            "median_s": round(statistics.median(durations), 4),
+            "min_s": round(min(durations), 4),
+            "max_s": round(max(durations), 4),
+        }
+
+
+def run(runs: int, size_mb: float, archive_format: str, latency: float, token: bool) -> dict:
+    with FakeServer(int(size_mb * MB), archive_format, latency) as server:
+        runner = Runner(server, token)
+
+        def install_all(home: Path):
+            runner.mercado(home, "install", *INSTALLED, "--jobs", "4")
+
+        def install_all_cold(home: Path):
+            install_all(home)
+            shutil.rmtree(home / ".mercado" / "cache")
+
+        def install_all_warm(home: Path):
+            install_all(home)
+            runner.mercado(home, "list", "--verbose")
+
+        # Artifacts are synthesized on their first request, a first pass keeps that out of the measurements
+        runner.measure(1, lambda home: runner.mercado(home, "install", *INSTALLED, "--jobs", "4"))
+
+        results = {
+            "cold_start": runner.measure(runs, lambda home: runner.mercado(home, "--help", routed=False)),
+            "list_verbose_cold": runner.measure(
+                runs, lambda home: runner.mercado(home, "list", "--verbose"), install_all_cold
+            ),
+            "list_verbose_warm": runner.measure(
+                runs, lambda home: runner.mercado(home, "list", "--verbose"), install_all_warm
+            ),
+            "install_single": runner.measure(runs, lambda home: runner.mercado(home, "install", "gh")),
+            "install_multi": runner.measure(
+                runs, lambda home: runner.mercado(home, "install", *INSTALLED, "--jobs", "4")
+            ),
+        }
+
+    return {
+        "benchmark": "cli",
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": f"{platform.system()}-{platform.machine()}",
+        "params": {
+            "runs": runs,
+            "size_mb": size_mb,
+            "format": archive_format,
+            "latency_s": latency,
+            "token": token,
+            "installed": INSTALLED,
+        },
+        "results": results,
+    }
+
+
+def get_commit() -> str:
+    res = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return res.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--size", type=float, default=8, help="artifact size in MB")
+    parser.add_argument("--format", choices=ARCHIVE_FORMATS, default="", help="repack the archives in this format")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--token", action="store_true", help="authenticate to GitHub (GraphQL batching)")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.runs, args.size, args.format, args.latency, args.token)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
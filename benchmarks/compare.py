@@ -0,0 +1,43 @@
+"""
+Compare two result files of the CLI benchmark, e.g. of the main branch and of a change.
+The median of every scenario is compared, a change within the noise of the runs is reported as such.
+
+    python3 -m benchmarks.compare main.json change.json
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+
+def compare(base: dict, head: dict) -> list[tuple[str, float, float, str]]:
+    rows = []
+    for name, result in head["results"].items():
+        if name not in base["results"]:
+            continue
+
+        before, after = base["results"][name], result
+        change = (after["median_s"] - before["median_s"]) / before["median_s"] * 100
+        # The ranges of the runs overlap, the difference between the medians may only be noise
+        noise = after["min_s"] <= before["max_s"] and before["min_s"] <= after["max_s"]
+        rows.append((name, before["median_s"], after["median_s"], f"{change:+.1f}%" + (" (noise)" if noise else "")))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", type=Path)
+    parser.add_argument("head", type=Path)
+    args = parser.parse_args()
+
+    base, head = json.loads(args.base.read_text()), json.loads(args.head.read_text())
+    if base["params"] != head["params"]:
+        print(f"Warning: the results were measured with different parameters: {base['params']} {head['params']}")
+
+    print(f"{'scenario':<20} {base['commit'] or 'base':>10} {head['commit'] or 'head':>10}  change")
+    for name, before, after, change in compare(base, head):
+        print(f"{name:<20} {before:>9.3f}s {after:>9.3f}s  {change}")
+
+
+if __name__ == "__main__":
+    main()
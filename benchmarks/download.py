@@ -0,0 +1,67 @@
+"""
+Download throughput benchmark.
+Serves a generated file from a local HTTP server and reports the throughput of the download loop in MB/s.
+
+    python3 -m benchmarks.download --size 200 --runs 3
+"""
+
+import argparse
+import json
+import os
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+from mercado.download import stream_to_file
+from mercado.utils import STREAM_MAX_TIMEOUT, get_session
+
+MB = 1024 * 1024
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=directory))
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(size_mb: int, runs: int) -> dict:
+    with TemporaryDirectory(prefix="mercado-bench-") as root:
+        artifact = Path(root) / "artifact.bin"
+        with artifact.open("wb") as file:
+            for _ in range(size_mb):
+                file.write(os.urandom(MB))
+
+        server = serve(root)
+        url = f"http://127.0.0.1:{server.server_port}/{artifact.name}"
+        results = []
+        try:
+            for _ in range(runs):
+                start = time.perf_counter()
+                with get_session().get(url, stream=True, timeout=STREAM_MAX_TIMEOUT) as r, open(os.devnull, "wb") as f:
+                    size = stream_to_file(r, f, lambda _: None)
+                results.append(size / MB / (time.perf_counter() - start))
+        finally:
+            server.shutdown()
+
+    return {"benchmark": "download", "size_mb": size_mb, "runs": runs, "mb_per_sec": max(results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200, help="artifact size in MB")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.size, args.runs)))
+
+
+if __name__ == "__main__":
+    main()
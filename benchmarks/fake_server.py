@@ -0,0 +1,459 @@
+"""
+Local stand-in for the GitHub and Hashicorp release APIs and the hosts their artifacts are downloaded from.
+Release metadata is replayed from data/releases.json (and the asset names of data/assets.json),
+artifacts are synthesized on demand: a shell script printing the tool version, padded to the configured size,
+either bare or packed in an archive. Checksum files list the digests of the synthesized artifacts.
+
+Requests to any https host are routed to the server with the host as the first path segment,
+so mercado talks to it without knowing (see route()).
+
+    python3 -m benchmarks.fake_server --port 8080 --size 8 --latency 0.05
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import tarfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlsplit
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+from requests import PreparedRequest, Session
+from requests.adapters import HTTPAdapter
+
+DATA_DIR = Path(__file__).parent / "data"
+RELEASES = DATA_DIR / "releases.json"
+CORPUS = DATA_DIR / "assets.json"
+
+ARCHIVE_FORMATS = ("tar.gz", "zip", "binary")
+ARCHIVE_PATTERN = re.compile(r"\.(tar\.gz|tgz|zip)(?=$|\.)")
+# Assets mercado never installs are served as a few bytes, only binaries and archives have the configured size
+SMALL_SUFFIXES = (".sig", ".pem", ".asc", ".pub", ".json", ".jsonl", ".txt", ".deb", ".rpm", ".apk", ".msi")
+CHECKSUM_SUFFIXES = (".sha256", ".sha256sum")
+HASHICORP_PLATFORMS = [("linux", "amd64"), ("linux", "arm64"), ("darwin", "amd64"), ("darwin", "arm64")]
+BINARY_PLATFORMS = {"os": ("linux", "darwin"), "arch": ("amd64", "arm64")}
+RATE_LIMIT = 5000
+GITHUB_RELEASES_PATTERN = re.compile(
+    r"repos/(?P<repository>[^/]+/[^/]+)/releases(?:/(?P<kind>latest|tags)(?:/(?P<tag>.+))?)?"
+)
+SCRIPT = '#!/bin/sh\necho "{tool} version {version}"\nexit 0\n'
+
+
+class FakeServer:
+    def __init__(
+        self,
+        artifact_size: int = 64 * 1024,
+        archive_format: str = "",
+        latency: float = 0.0,
+        compresslevel: int = 1,
+        port: int = 0,
+    ):
+        """
+        archive_format repacks every archive asset (and Hashicorp build) as 'tar.gz', 'zip' or a bare 'binary',
+        the recorded formats are kept when it's empty. latency is added to every response, in seconds.
+        """
+        if archive_format and archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"archive_format should be one of {ARCHIVE_FORMATS}")
+
+        self.artifact_size = artifact_size
+        self.archive_format = archive_format
+        self.latency = latency
+        self.compresslevel = compresslevel
+        self.requests: Counter[str] = Counter()
+        # Every request as (method, host and path with the query), e.g. to assert which requests a lookup sent
+        self.log: list[tuple[str, str]] = []
+
+        self._releases = json.loads(RELEASES.read_text())
+        self._corpus = json.loads(CORPUS.read_text())
+        self._binaries = {
+            name: (_compile_url_pattern(binary["pattern"]), binary["repository"])
+            for name, binary in self._releases["binaries"].items()
+        }
+        # Random data doesn't compress, like real binaries, it's generated once and shared by all the artifacts
+        self._filler = random.Random(0).randbytes(artifact_size)
+        self._artifacts: dict[str, bytes] = {}
+        self._lock = Lock()
+        self._started = time.time()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), partial(FakeHandler, self))
+        self._thread: Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeServer":
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def route(self, session: Session):
+        route(session, self.url)
+
+    def respond(self, method: str, url: str, body: bytes = b"") -> tuple[int, dict[str, str], bytes]:
+        """The status, headers and body of the response to a request for url (host and path, without a scheme)"""
+        host, _, path = url.partition("/")
+        path, _, query = path.partition("?")
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        with self._lock:
+            self.requests[host] += 1
+            self.log.append((method, url))
+
+        if host == "api.github.com":
+            return self._github_api(method, path, params, body)
+        if host == "github.com":
+            return self._github_download(path)
+        if host == "api.releases.hashicorp.com":
+            return self._hashicorp_api(path, params)
+        if host == "releases.hashicorp.com":
+            return self._hashicorp_download(path)
+        if (page := self._releases["pages"].get(f"{host}/{path}")) is not None:
+            return _text(page)
+        return self._binary(f"{host}/{path}")
+
+    # GitHub
+
+    def _github_tags(self, repository: str) -> list[str]:
+        return self._releases["github"][repository]["tags"] if repository in self._releases["github"] else []
+
+    def _github_assets(self, repository: str, tag: str) -> list[str]:
+        """The recorded assets, renamed after the version of the tag"""
+        recorded = self._releases["github"][repository]["recorded"]
+        names = self._corpus.get(repository, {}).get("assets", [])
+        if recorded:
+            names = [name.replace(recorded, tag.lstrip("v")) for name in names]
+        return list(dict.fromkeys(map(self._repack, names)))
+
+    def _github_release(self, repository: str, tag: str) -> dict:
+        index = self._github_tags(repository).index(tag)
+        return {
+            "tag_name": tag,
+            "name": tag,
+            "draft": False,
+            "prerelease": "-" in tag,
+            "published_at": _timestamp(index),
+            "assets": [
+                {
+                    "name": name,
+                    "browser_download_url": f"https://github.com/{repository}/releases/download/{tag}/{name}",
+                }
+                for name in self._github_assets(repository, tag)
+            ],
+        }
+
+    def _github_api(self, method: str, path: str, params: dict, body: bytes) -> tuple[int, dict, bytes]:
+        if method == "POST" and path == "graphql":
+            return self._github_graphql(json.loads(body))
+
+        match = GITHUB_RELEASES_PATTERN.fullmatch(path)
+        if not match or not (tags := self._github_tags(match["repository"])):
+            return _json({"message": "Not Found"}, HTTPStatus.NOT_FOUND, self._rate_limit("core"))
+
+        repository = match["repository"]
+        if match["kind"] == "latest":
+            # Pre-releases are never the latest release
+            data = self._github_release(repository, next(tag for tag in tags if "-" not in tag))
+        elif match["kind"] == "tags":
+            if match["tag"] not in tags:
+                return _json({"message": "Not Found"}, HTTPStatus.NOT_FOUND, self._rate_limit("core"))
+            data = self._github_release(repository, match["tag"])
+        else:
+            per_page, page = int(params.get("per_page", 30)), int(params.get("page", 1))
+            data = [self._github_release(repository, tag) for tag in tags[(page - 1) * per_page : page * per_page]]
+        return _json(data, headers=self._rate_limit("core"))
+
+    def _github_graphql(self, request: dict) -> tuple[int, dict, bytes]:
+        variables = request["variables"]
+        data = {}
+        for key in variables:
+            if key.startswith("owner"):
+                index = key.removeprefix("owner")
+                repository = f"{variables[key]}/{variables[f'name{index}']}"
+                tags = [tag for tag in self._github_tags(repository) if "-" not in tag]
+                data[f"r{index}"] = {"latestRelease": {"tagName": tags[0]}} if tags else None
+        return _json({"data": data}, headers=self._rate_limit("graphql"))
+
+    def _rate_limit(self, resource: str) -> dict[str, str]:
+        with self._lock:
+            used = self.requests["api.github.com"]
+        return {
+            "X-RateLimit-Limit": str(RATE_LIMIT),
+            "X-RateLimit-Remaining": str(max(RATE_LIMIT - used, 0)),
+            "X-RateLimit-Reset": str(int(self._started + 3600)),
+            "X-RateLimit-Resource": resource,
+        }
+
+    def _github_download(self, path: str) -> tuple[int, dict, bytes]:
+        match = re.fullmatch(r"(?P<repository>[^/]+/[^/]+)/releases/download/(?P<tag>[^/]+)/(?P<name>[^/]+)", path)
+        if not match or match["tag"] not in self._github_tags(match["repository"]):
+            return _text("Not Found", HTTPStatus.NOT_FOUND)
+
+        repository, tag, name = match["repository"], match["tag"], match["name"]
+        assets = self._github_assets(repository, tag)
+        if name not in assets:
+            return _text("Not Found", HTTPStatus.NOT_FOUND)
+
+        tool = self._corpus[repository]["tool"]
+        if _is_checksums(name):
+            # An <asset>.sha256 file covers its asset, other checksum files cover the whole release
+            base = _strip_checksum_suffix(name)
+            covered = [base] if base != name and base in assets else assets
+            return _text(self._checksums(f"github.com/{repository}/{tag}", tool, tag, covered))
+        return _octet_stream(self._artifact(f"github.com/{repository}/{tag}", tool, tag, name))
+
+    # Hashicorp
+
+    def _hashicorp_release(self, name: str, version: str) -> dict:
+        index = self._releases["hashicorp"][name].index(version)
+        base_url = f"https://releases.hashicorp.com/{name}/{version}"
+        return {
+            "name": name,
+            "version": version,
+            "timestamp_created": _timestamp(index),
+            "url_shasums": f"{base_url}/{name}_{version}_SHA256SUMS",
+            "builds": [
+                {"os": os, "arch": arch, "url": f"{base_url}/{self._repack(f'{name}_{version}_{os}_{arch}.zip')}"}
+                for os, arch in HASHICORP_PLATFORMS
+            ],
+        }
+
+    def _hashicorp_api(self, path: str, params: dict) -> tuple[int, dict, bytes]:
+        products = self._releases["hashicorp"]
+        if path == "v1/products":
+            return _json(sorted(products))
+
+        match = re.fullmatch(r"v1/releases/(?P<name>[^/]+)(?:/(?P<version>[^/]+))?", path)
+        if not match or match["name"] not in products:
+            return _json({"message": "Not Found"}, HTTPStatus.NOT_FOUND)
+
+        name = match["name"]
+        if version := match["version"]:
+            if version not in products[name]:
+                return _json({"message": "Not Found"}, HTTPStatus.NOT_FOUND)
+            return _json(self._hashicorp_release(name, version))
+
+        releases = [self._hashicorp_release(name, version) for version in products[name]]
+        if after := params.get("after"):
+            releases = [release for release in releases if release["timestamp_created"] < after]
+        return _json(releases[: min(int(params.get("limit", 10)), 20)])
+
+    def _hashicorp_download(self, path: str) -> tuple[int, dict, bytes]:
+        match = re.fullmatch(r"(?P<name>[^/]+)/(?P<version>[^/]+)/(?P<file>[^/]+)", path)
+        if not match or match["version"] not in self._releases["hashicorp"].get(match["name"], []):
+            return _text("Not Found", HTTPStatus.NOT_FOUND)
+
+        name, version, file = match["name"], match["version"], match["file"]
+        builds = [build["url"].rsplit("/", 1)[1] for build in self._hashicorp_release(name, version)["builds"]]
+        if file == f"{name}_{version}_SHA256SUMS":
+            return _text(self._checksums(f"hashicorp/{name}/{version}", name, version, builds))
+        if file not in builds:
+            return _text("Not Found", HTTPStatus.NOT_FOUND)
+        return _octet_stream(self._artifact(f"hashicorp/{name}/{version}", name, version, file))
+
+    # Binaries that are downloaded from a URL built out of the version and the platform
+
+    def _binary(self, url: str) -> tuple[int, dict, bytes]:
+        for name, (pattern, repository) in self._binaries.items():
+            if (
+                (match := pattern.match(url))
+                and match["version"] in self._github_tags(repository)
+                and match["os"] in BINARY_PLATFORMS["os"]
+                and match["arch"] in BINARY_PLATFORMS["arch"]
+            ):
+                return _octet_stream(self._artifact(url, name, match["version"], name))
+        return _text("Not Found", HTTPStatus.NOT_FOUND)
+
+    # Artifacts
+
+    def _repack(self, name: str) -> str:
+        if not self.archive_format or _is_checksums(name) or name.endswith(SMALL_SUFFIXES):
+            return name
+        extension = "" if self.archive_format == "binary" else f".{self.archive_format}"
+        return ARCHIVE_PATTERN.sub(extension, name)
+
+    def _artifact(self, release: str, tool: str, version: str, name: str) -> bytes:
+        key = f"{release}/{name}"
+        with self._lock:
+            if key in self._artifacts:
+                return self._artifacts[key]
+
+        if name.endswith(SMALL_SUFFIXES):
+            content = f"{name}\n".encode()
+        else:
+            script = SCRIPT.format(tool=tool, version=version.lstrip("v")).encode()
+            content = _pack(name, tool, script + self._filler[len(script) :], self.compresslevel)
+
+        with self._lock:
+            return self._artifacts.setdefault(key, content)
+
+    def _checksums(self, release: str, tool: str, version: str, names: list[str]) -> str:
+        lines = []
+        for name in names:
+            if not _is_checksums(name):
+                digest = hashlib.sha256(self._artifact(release, tool, version, name)).hexdigest()
+                lines.append(f"{digest}  {name}")
+        return "\n".join(lines) + "\n"
+
+
+def _pack(name: str, tool: str, content: bytes, compresslevel: int) -> bytes:
+    """The content as the executable tool, inside an archive when the name is one"""
+    buffer = io.BytesIO()
+    directory = ARCHIVE_PATTERN.sub("", name)
+
+    if name.endswith((".tar.gz", ".tgz")):
+        with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=compresslevel) as archive:
+            info = tarfile.TarInfo(f"{directory}/{tool}")
+            info.size, info.mode = len(content), 0o755
+            archive.addfile(info, io.BytesIO(content))
+    elif name.endswith(".zip"):
+        with ZipFile(buffer, "w", ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+            info = ZipInfo(f"{directory}/{tool}")
+            info.external_attr = 0o755 << 16
+            archive.writestr(info, content, ZIP_DEFLATED)
+    else:
+        return content
+    return buffer.getvalue()
+
+
+def _compile_url_pattern(pattern: str) -> re.Pattern:
+    """A pattern like 'host/{version}/{os}' with a named group for every placeholder"""
+    parts = re.split(r"\{(\w+)\}", pattern)
+    # Placeholder names are at the odd indexes
+    return re.compile(
+        "".join(f"(?P<{part}>[^/]+)" if index % 2 else re.escape(part) for index, part in enumerate(parts)) + "$"
+    )
+
+
+def _is_checksums(name: str) -> bool:
+    return "checksums" in name.lower() or "SHA256SUMS" in name or name.endswith(CHECKSUM_SUFFIXES)
+
+
+def _strip_checksum_suffix(name: str) -> str:
+    for suffix in CHECKSUM_SUFFIXES:
+        name = name.removesuffix(suffix)
+    return name
+
+
+def _timestamp(index: int) -> str:
+    """Releases are a week apart, the newest one (index 0) is the latest"""
+    created = datetime(2024, 2, 1, tzinfo=timezone.utc) - timedelta(weeks=index)
+    return created.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _json(data, status: HTTPStatus = HTTPStatus.OK, headers: dict | None = None) -> tuple[int, dict, bytes]:
+    return status.value, {"Content-Type": "application/json", **(headers or {})}, json.dumps(data).encode()
+
+
+def _text(text: str, status: HTTPStatus = HTTPStatus.OK) -> tuple[int, dict, bytes]:
+    return status.value, {"Content-Type": "text/plain"}, text.encode()
+
+
+def _octet_stream(content: bytes) -> tuple[int, dict, bytes]:
+    return HTTPStatus.OK.value, {"Content-Type": "application/octet-stream", "Accept-Ranges": "bytes"}, content
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, fake: FakeServer, *args, **kwargs):
+        self.fake = fake
+        super().__init__(*args, **kwargs)
+
+    def _handle(self, send_body: bool = True):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status, headers, content = self.fake.respond(self.command, self.path.lstrip("/"), body)
+        time.sleep(self.fake.latency)
+
+        # Responses are revalidated by their ETag and artifacts can be requested by range, like the real hosts
+        etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        start, end = 0, len(content)
+        if status == HTTPStatus.OK.value and self.headers.get("If-None-Match") == etag:
+            status, content = HTTPStatus.NOT_MODIFIED.value, b""
+        elif (
+            status == HTTPStatus.OK.value
+            and (match := re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", "")))
+            and self.headers.get("If-Range", etag) == etag
+        ):
+            start, end = int(match[1]), min(int(match[2] or end - 1) + 1, end)
+            status = HTTPStatus.PARTIAL_CONTENT.value
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(content)}"
+
+        self.send_response(status)
+        for key, value in (headers | {"ETag": etag, "Content-Length": str(end - start)}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if send_body:
+            try:
+                self.wfile.write(memoryview(content)[start:end])
+            except ConnectionError:
+                self.close_connection = True
+
+    def do_GET(self):  # noqa: N802
+        self._handle()
+
+    def do_HEAD(self):  # noqa: N802
+        self._handle(send_body=False)
+
+    def do_POST(self):  # noqa: N802
+        self._handle()
+
+    def log_message(self, *args):
+        pass
+
+
+class RoutingAdapter(HTTPAdapter):
+    """Sends the requests to the fake server, the host they were sent to becomes the first segment of the path"""
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request: PreparedRequest, **kwargs):
+        url = urlsplit(request.url)
+        request.url = f"{self.base_url}/{url.netloc}{url.path}" + (f"?{url.query}" if url.query else "")
+        return super().send(request, **kwargs)
+
+
+def route(session: Session, base_url: str):
+    """Send all the https requests of the session to the fake server at base_url"""
+    session.mount("https://", RoutingAdapter(base_url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--size", type=float, default=1, help="artifact size in MB")
+    parser.add_argument("--format", choices=ARCHIVE_FORMATS, default="", help="repack the archives in this format")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    with FakeServer(int(args.size * 1024 * 1024), args.format, args.latency, port=args.port) as server:
+        print(f"Serving on {server.url}, route https requests to {server.url}/<host>/<path>")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+"""
+The mercado CLI with its https requests sent to the fake server at MERCADO_FAKE_SERVER_URL.
+
+    MERCADO_FAKE_SERVER_URL=http://127.0.0.1:8080 python3 -m benchmarks.routed list --verbose
+"""
+
+from os import environ
+
+from benchmarks.fake_server import route
+from mercado.cli import main
+from mercado.utils import get_session
+
+if __name__ == "__main__":
+    route(get_session(), environ["MERCADO_FAKE_SERVER_URL"])
+    main()
@@ -0,0 +1,10 @@
+#!/usr/bin/env bash
+
+set -o nounset
+set -o pipefail
+set -o errexit
+set -o xtrace
+
+python3 -m benchmarks.download
+python3 -m benchmarks.assets
+python3 -m benchmarks.cli
@@ -0,0 +1,156 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import cache
+from typing import Callable
+
+from .utils import MATRIX_ARM64, MATRIX_MAC, MATRIX_X86_64, SUPPORTED_ARCHIVE_FORMATS
+
+# Canonical operating systems and architectures by the way they are spelled in asset names
+OS_ALIASES = {alias: "darwin" for alias in MATRIX_MAC} | {
+    name: name for name in ("linux", "windows", "freebsd", "openbsd", "netbsd", "solaris", "illumos", "android")
+}
+ARCH_ALIASES = (
+    {alias: "amd64" for alias in MATRIX_X86_64}
+    | {alias: "arm64" for alias in MATRIX_ARM64}
+    | {alias: "386" for alias in ("386", "i386", "x86", "32bit")}
+    | {alias: "arm" for alias in ("arm", "armv6", "armv7", "armhf")}
+    | {name: name for name in ("ppc64le", "s390x", "riscv64")}
+)
+
+# Preferred formats first, assets of any other format are only chosen when there is nothing else
+FORMAT_RANKS = {"binary": 0, "archive": 1, "dmg": 2}
+FORMAT_EXTENSIONS = {
+    ".dmg": "dmg",
+    ".exe": "binary",
+    **{extension: "package" for extension in (".deb", ".rpm", ".apk", ".msi", ".pkg", ".snap", ".appimage")},
+    **{extension: "other" for extension in (".txt", ".json", ".yaml", ".yml", ".md", ".html", ".spdx")},
+    **{extension: "other" for extension in (".sig", ".pem", ".asc", ".pub", ".sha256", ".sha256sum", ".sha512")},
+}
+
+
+def _aliases_pattern(aliases: dict[str, str], suffix: str) -> re.Pattern:
+    # Longer aliases first, so x86_64 isn't matched as x86
+    alternatives = "|".join(map(re.escape, sorted(aliases, key=len, reverse=True)))
+    return re.compile(rf"(?<![a-z])({alternatives}){suffix}", re.IGNORECASE)
+
+
+# Operating systems may be followed by a bitness (linux64), architectures must end the token (arm, not armada)
+OS_PATTERN = _aliases_pattern(OS_ALIASES, r"(?![a-z])")
+ARCH_PATTERN = _aliases_pattern(ARCH_ALIASES, r"(?![a-z0-9])")
+VERSION_PATTERN = re.compile(r"[-_.]v?\d")
+ARCHIVE_PATTERN = re.compile(
+    "(" + "|".join(map(re.escape, sorted(SUPPORTED_ARCHIVE_FORMATS, key=len, reverse=True))) + ")$", re.IGNORECASE
+)
+EXTENSION_PATTERN = re.compile(r"\.[a-z][a-z0-9]*$", re.IGNORECASE)
+CHECKSUM_PATTERN = re.compile(
+    r"checksum|sha(1|256|512)|shasum|sbom|provenance|\.(sig|pem|asc|cert|crt|key|pub|bundle|intoto\.jsonl)$",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class Asset:
+    """A release asset, as described by its name"""
+
+    name: str
+    url: str
+    tool: str
+    os: str
+    arch: str
+    format: str
+    is_checksum: bool
+
+
+@cache
+def classify_asset(name: str, url: str = "") -> Asset:
+    """Parse the asset name once into the tool, platform and format it was built for"""
+    if match := ARCHIVE_PATTERN.search(name):
+        format, extension = "archive", match[0]
+    elif (match := EXTENSION_PATTERN.search(name)) and match[0].lower() in FORMAT_EXTENSIONS:
+        format, extension = FORMAT_EXTENSIONS[match[0].lower()], match[0]
+    else:
+        # The suffix of a bare binary is usually part of its version or platform (sops-v3.8.1.linux.amd64)
+        format, extension = "binary", ""
+    base = name.removesuffix(extension)
+
+    os_match = OS_PATTERN.search(base)
+    arch_match = ARCH_PATTERN.search(base)
+    version_match = VERSION_PATTERN.search(base)
+
+    # The tool name is what comes before the version or the platform
+    tool_end = min((match.start() for match in (os_match, arch_match, version_match) if match), default=len(base))
+    return Asset(
+        name=name,
+        url=url,
+        tool=base[:tool_end].rstrip("-_.").lower(),
+        os=OS_ALIASES[os_match[1].lower()] if os_match else "",
+        arch=ARCH_ALIASES[arch_match[1].lower()] if arch_match else "",
+        format=format,
+        is_checksum=bool(CHECKSUM_PATTERN.search(name)),
+    )
+
+
+def canonical_os(os: str) -> str:
+    return OS_ALIASES.get(os.lower(), os.lower())
+
+
+def canonical_arch(arch: str) -> str:
+    return ARCH_ALIASES.get(arch.lower(), arch.lower())
+
+
+class AssetIndex:
+    """Release assets classified once and indexed by platform, so choosing one doesn't scan the whole release"""
+
+    def __init__(self, assets: list[Asset]):
+        self.assets = assets
+        self._platforms: dict[tuple[str, str], list[Asset]] = defaultdict(list)
+        for asset in assets:
+            if not asset.is_checksum:
+                self._platforms[asset.os, asset.arch].append(asset)
+
+    @classmethod
+    def from_urls(cls, urls: list[str]) -> "AssetIndex":
+        return cls([classify_asset(url.rsplit("/", 1)[-1], url) for url in urls])
+
+    def select(self, name: str, os: str, arch: str, templates: list[str] | None = None) -> str:
+        """
+        The URL of the asset of the tool for the platform, or an empty string if there is none.
+        An asset whose name appears in one of the templates is chosen as is, otherwise the candidates are ranked by
+        whether they are named after the tool exactly (kubectx and not kubectx-completions) and then by format.
+        """
+        templates = [template.lower() for template in templates or []]
+        for asset in self.assets:
+            if not asset.is_checksum and any(asset.name.lower() in template for template in templates):
+                return asset.url
+
+        name = name.lower()
+        candidates = [
+            asset for asset in self._platforms.get((canonical_os(os), canonical_arch(arch)), []) if name in asset.tool
+        ]
+        return rank_assets(candidates, lambda asset: int(asset.tool != name))
+
+    def choose(self) -> str:
+        """The URL of the preferred asset when all of them are for the same tool and platform"""
+        return rank_assets([asset for asset in self.assets if not asset.is_checksum])
+
+
+def rank_assets(candidates: list[Asset], key: Callable[[Asset], int] | None = None) -> str:
+    """The URL of the best candidate by key and then by format, candidates of unknown formats are a last resort"""
+    if len(candidates) == 1:
+        return candidates[0].url
+
+    ranks: dict[tuple[int, int], list[Asset]] = defaultdict(list)
+    for asset in candidates:
+        if asset.format in FORMAT_RANKS:
+            ranks[key(asset) if key else 0, FORMAT_RANKS[asset.format]].append(asset)
+
+    if not ranks:
+        return ""
+    if len(best := ranks[min(ranks)]) > 1:
+        raise ValueError(f"There are several valid assets: {[asset.name for asset in best]}, Please file a bug")
+    return best[0].url
+
+
+def choose_url(urls: list[str]) -> str:
+    return AssetIndex.from_urls(urls).choose()
@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from functools import cache
+from hashlib import file_digest, sha256
+from http import HTTPStatus
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import get_ident
+from typing import Any, Callable
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from .tracing import span
+from .utils import CACHE_DIR, get_session, link_or_copy
+
+HTTP_CACHE_MAX_SIZE = 50 * 1024 * 1024
+ARTIFACT_CACHE_MAX_SIZE = int(os.environ.get("MERCADO_ARTIFACT_CACHE_MAX_SIZE", 1024 * 1024 * 1024))
+FETCH_URL_CACHE_TTL = 10 * 60
+
+
+class DiskCache:
+    """JSON values stored on disk, each one expiring after its own TTL"""
+
+    def __init__(self, directory: Path):
+        self._directory = directory
+
+    def _path(self, key: str) -> Path:
+        return self._directory / f"{sha256(key.encode()).hexdigest()}.json"
+
+    def get(self, key: str, ttl: float) -> Any | None:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("key") != key or time.time() - entry.get("created", 0) > ttl:
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any):
+        entry = {"key": key, "created": time.time(), "value": value}
+        try:
+            write_atomic(self._path(key), json.dumps(entry).encode())
+        except OSError as ex:
+            logging.debug(f"Could not write cache entry for '{key}': {ex}")
+
+    def get_or_set(self, key: str, ttl: float, func: Callable[[], Any]) -> Any:
+        value = self.get(key, ttl)
+        if value is None:
+            value = func()
+            self.set(key, value)
+        else:
+            logging.debug(f"Using cached value for '{key}'")
+        return value
+
+
+class HTTPCache:
+    """
+    Response bodies stored on disk together with their validators.
+    Fresh entries are served without any network call, stale ones are revalidated
+    with a conditional request so an unchanged resource costs a 304 instead of a full download.
+    The least recently used entries are evicted once the cache grows beyond max_size.
+    """
+
+    def __init__(self, directory: Path, max_size: int = HTTP_CACHE_MAX_SIZE):
+        self._directory = directory
+        self._max_size = max_size
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = sha256(url.encode()).hexdigest()
+        return self._directory / f"{key}.json", self._directory / f"{key}.body"
+
+    def _load(self, url: str) -> tuple[dict | None, bytes | None]:
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None, None
+
+        if meta.get("url") != url:
+            return None, None
+        return meta, body
+
+    def _store(self, url: str, meta: dict, body: bytes | None = None):
+        meta_path, body_path = self._paths(url)
+        try:
+            if body is not None:
+                write_atomic(body_path, body)
+            write_atomic(meta_path, json.dumps(meta).encode())
+        except OSError as ex:
+            logging.debug(f"Could not cache the response of {url}: {ex}")
+            return
+
+        if body is not None:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for meta_path in self._directory.glob("*.json"):
+            body_path = meta_path.with_suffix(".body")
+            with suppress(OSError):
+                size = meta_path.stat().st_size + body_path.stat().st_size
+                entries.append((meta_path.stat().st_mtime, size, meta_path, body_path))
+                total_size += size
+
+        for _, size, meta_path, body_path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            logging.debug(f"Evicting {meta_path.stem} from the HTTP cache")
+            meta_path.unlink(missing_ok=True)
+            body_path.unlink(missing_ok=True)
+            total_size -= size
+
+    @staticmethod
+    def _response(url: str, meta: dict, body: bytes) -> Response:
+        res = Response()
+        res.url = url
+        res.status_code = HTTPStatus.OK.value
+        res.headers = CaseInsensitiveDict(meta.get("headers", {}))
+        res.encoding = meta.get("encoding")
+        res._content = body
+        return res
+
+    def get(self, url: str, ttl: float, headers: dict | None = None) -> Response:
+        meta, body = self._load(url)
+
+        if meta and time.time() - meta["validated"] <= ttl:
+            logging.debug(f"Using cached response for {url}")
+            with suppress(OSError):
+                os.utime(self._paths(url)[0])
+            return self._response(url, meta, body)
+
+        headers = dict(headers or {})
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with span("http.get", url=url):
+            res = get_session().get(url, headers=headers)
+
+        if meta and res.status_code == HTTPStatus.NOT_MODIFIED.value:
+            logging.debug(f"{url} was not modified, using cached response")
+            meta["validated"] = time.time()
+            self._store(url, meta)
+            return self._response(url, meta, body)
+
+        if res.status_code == HTTPStatus.OK.value:
+            meta = {
+                "url": url,
+                "validated": time.time(),
+                "etag": res.headers.get("ETag"),
+                "last_modified": res.headers.get("Last-Modified"),
+                "encoding": res.encoding,
+                "headers": {"Content-Type": res.headers.get("Content-Type", "")},
+            }
+            self._store(url, meta, res.content)
+        return res
+
+
+@dataclass
+class Artifact:
+    url: str
+    digest: str
+    size: int
+    last_used: float
+
+
+class ArtifactStore:
+    """
+    Downloaded artifacts, stored once per content digest and looked up by their URL.
+    Artifacts are linked in and out of the store when possible, so caching them doesn't copy any data.
+    The least recently used artifacts are evicted once the store grows beyond max_size.
+    """
+
+    def __init__(self, directory: Path, max_size: int = ARTIFACT_CACHE_MAX_SIZE):
+        self._refs = directory / "refs"
+        self._blobs = directory / "blobs"
+        self.max_size = max_size
+
+    def _ref_path(self, url: str) -> Path:
+        return self._refs / f"{sha256(url.encode()).hexdigest()}.json"
+
+    def _load(self, ref_path: Path) -> Artifact | None:
+        try:
+            ref = json.loads(ref_path.read_text())
+            blob_stat = (self._blobs / ref["digest"]).stat()
+        except (OSError, ValueError, KeyError):
+            return None
+        return Artifact(ref["url"], ref["digest"], blob_stat.st_size, blob_stat.st_mtime)
+
+    def get(self, url: str) -> Artifact | None:
+        artifact = self._load(self._ref_path(url))
+        if artifact and artifact.url == url:
+            return artifact
+        return None
+
+    def link(self, url: str, dest: Path, checksum: str = "") -> bool:
+        if not (artifact := self.get(url)):
+            return False
+
+        if checksum and artifact.digest != checksum:
+            logging.debug(f"The cached artifact of {url} does not match the checksum {checksum}")
+            return False
+
+        blob = self._blobs / artifact.digest
+        try:
+            # The modification time of a blob is when it was last used
+            os.utime(blob)
+            link_or_copy(blob, dest)
+        except OSError as ex:
+            logging.debug(f"Could not use the cached artifact of {url}: {ex}")
+            return False
+        return True
+
+    def add(self, url: str, path: Path, digest: str = "") -> str:
+        if not digest:
+            with path.open("rb") as file:
+                digest = file_digest(file, "sha256").hexdigest()
+
+        blob = self._blobs / digest
+        try:
+            if blob.exists():
+                os.utime(blob)
+            else:
+                self._blobs.mkdir(exist_ok=True, parents=True)
+                temp_blob = self._blobs / f".{digest}.{os.getpid()}.{get_ident()}"
+                link_or_copy(path, temp_blob)
+                os.replace(temp_blob, blob)
+
+            write_atomic(self._ref_path(url), json.dumps({"url": url, "digest": digest}).encode())
+        except OSError as ex:
+            logging.debug(f"Could not cache the artifact of {url}: {ex}")
+            return digest
+
+        self.prune(self.max_size)
+        return digest
+
+    def list_artifacts(self) -> list[Artifact]:
+        return list(filter(None, map(self._load, self._refs.glob("*.json"))))
+
+    def size(self) -> int:
+        return sum(blob.stat().st_size for blob in self._blobs.glob("[!.]*"))
+
+    def prune(self, max_size: int) -> list[Path]:
+        """Evict the least recently used artifacts until the store fits in max_size, returns the evicted blobs"""
+        blobs = []
+        total_size = 0
+        for blob in self._blobs.glob("[!.]*"):
+            with suppress(OSError):
+                blob_stat = blob.stat()
+                blobs.append((blob_stat.st_mtime, blob_stat.st_size, blob))
+                total_size += blob_stat.st_size
+
+        evicted = []
+        for _, size, blob in sorted(blobs):
+            if total_size <= max_size:
+                break
+            logging.debug(f"Evicting {blob.name} from the artifact cache")
+            blob.unlink(missing_ok=True)
+            evicted.append(blob)
+            total_size -= size
+
+        if evicted:
+            for ref_path in self._refs.glob("*.json"):
+                if self._load(ref_path) is None:
+                    ref_path.unlink(missing_ok=True)
+        return evicted
+
+
+def write_atomic(path: Path, data: bytes):
+    """Write to a sibling temporary file and rename it, so readers never observe a partial file"""
+    path.parent.mkdir(exist_ok=True, parents=True)
+    with NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", delete=False) as file:
+        file.write(data)
+    os.replace(file.name, path)
+
+
+@cache
+def fetch_url(url: str, raise_for_status: bool = True) -> str:
+    logging.debug(f"Fetching {url}")
+    res = http_cache.get(url, FETCH_URL_CACHE_TTL)
+    if raise_for_status:
+        res.raise_for_status()
+    return res.text
+
+
+disk_cache = DiskCache(CACHE_DIR)
+http_cache = HTTPCache(CACHE_DIR / "http")
+artifact_store = ArtifactStore(CACHE_DIR / "artifacts")
@@ -1,17 +1,40 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from os import environ
+from pathlib import Path
 from sys import exit
+from typing import Annotated
 
+from humanize import naturalsize, naturaltime
 from rich.console import Console
+from rich.live import Live
 from rich.logging import RichHandler
+from rich.progress import Progress
 from rich.table import Table
-from typer import Context, Exit, Option, Typer
+from typer import Argument, BadParameter, Context, Exit, Option, Typer
 
+from .cache import artifact_store
+from .profiling import DEPENDENCIES, PROFILE_TOP, ProfileMode, Profiler, import_times
 from .tool_manager import manager
-from .utils import get_host_architecture, get_host_operating_system, get_local_version, is_tool_available, run_once
-from .vendors.vendor import Label
+from .tracing import Tracer, enable_tracing, span
+from .utils import (
+    MAX_WORKERS,
+    get_host_architecture,
+    get_host_operating_system,
+    get_local_path,
+    get_session_stats,
+    is_tool_available,
+    log_session_stats,
+    path_index,
+    run_once,
+)
+from .vendors.github import rate_limiter
+from .vendors.vendor import Label, Tool
 
 app = Typer()
+cache_app = Typer(help="Manage the local artifact cache")
+app.add_typer(cache_app, name="cache")
 console = Console()
 
 
@@ -32,25 +55,29 @@ def list_tools(
     names_only: bool = Option(False),
     with_labels: bool = Option(False),
     show_all: bool = Option(False, "--all"),
+    jobs: int = Option(MAX_WORKERS, "--jobs", "-j", min=1, help="Number of tools to probe concurrently"),
 ):
-    table = Table(title="Mercado tools", header_style="bold magenta")
+    tools: list[tuple[Tool, bool]] = []
+    for tool in manager.get_tools(filter_labels):
+        exists = is_tool_available(tool)
+        if not exists and not show_all:
+            continue
+
+        tools.append((tool, exists))
 
-    @run_once
-    def add_table_column(*args, **kwargs):
-        table.add_column(*args, **kwargs)
+    statuses: dict[str, tuple[bool, bool, str, Path | None, str]] = {}
+    failures: dict[str, Exception] = {}
 
-    for _, tools in manager.get_supported_tools(separate_vendors=False):
-        if verbose:
-            table.add_section()
+    def render() -> Table:
+        table = Table(title="Mercado tools", header_style="bold magenta")
 
-        for tool in tools:
-            if filter_labels:
-                if not any([label in tool.labels for label in filter_labels]):
-                    continue
+        @run_once
+        def add_table_column(*args, **kwargs):
+            table.add_column(*args, **kwargs)
 
-            exists = is_tool_available(tool)
-            if not exists and not show_all:
-                continue
+        for tool, exists in tools:
+            if verbose:
+                table.add_section()
 
             add_table_column("Name", style="bold")
             cells = [tool.name]
@@ -60,24 +87,49 @@ def list_tools(
                 cells.append(pretty_bool(exists))
 
                 if verbose:
-                    exists, is_latest, version, path, _ = manager.get_status(tool.name)
                     add_table_column("Is Latest")
-                    cells.append(pretty_status(exists, is_latest))
-
                     add_table_column("Version")
-                    cells.append(version)
-
                     add_table_column("Path")
-                    if path:
-                        cells.append(str(path))
+
+                    if tool.name in statuses:
+                        exists, is_latest, version, path, _ = statuses[tool.name]
+                        cells.extend([pretty_status(exists, is_latest), version, str(path) if path else ""])
+                    elif tool.name in failures:
+                        cells.extend([":no_entry_sign:", "", ""])
+                    else:
+                        cells.extend([":hourglass:", "", ""])
 
                 if with_labels:
                     add_table_column("Labels")
                     cells.append(",".join(map(lambda item: item.value, tool.labels)))
 
             table.add_row(*cells)
+        return table
 
-    console.print(table)
+    if not verbose or names_only:
+        console.print(render())
+        return
+
+    # Local probes and remote lookups are mostly waiting on subprocesses and the network,
+    # so they run concurrently and the table is refreshed (still sorted) as each one completes
+    with Live(render(), console=console) as live:
+        for name, status, error in manager.iter_statuses([tool.name for tool, _ in tools], jobs):
+            if error is not None:
+                failures[name] = error
+            else:
+                statuses[name] = status
+            live.update(render())
+
+    print_network_report()
+    report_status_failures(failures)
+
+
+def print_network_report():
+    """The requests and bytes sent to every host and the remaining GitHub API budget"""
+    for host, (requests, connections, transferred) in get_session_stats().items():
+        console.print(f"{host}: {requests} requests over {connections} connections ({naturalsize(transferred)})")
+    for line in rate_limiter.report():
+        console.print(line)
 
 
 @app.command("install", help="Install a tool")
@@ -86,15 +138,48 @@ def install_tool(
     os: str = Option(get_host_operating_system()),
     arch: str = Option(get_host_architecture()),
     dry_run: bool = Option(False, envvar="DRY_RUN"),
+    jobs: Annotated[int, Option("--jobs", "-j", min=1, help="Number of tools to install concurrently")] = 1,
 ):
-    for name in names:
-        installer = manager.get_installer(name, os, arch)
-        logging.debug(f"'{installer.name}' was found with version '{installer.version}'")
+    if jobs > 1 and len(names) > 1:
+        install_tools_concurrently(names, os, arch, dry_run, jobs)
+        return
 
-        if not dry_run:
-            logging.info(f"Installing '{installer.name}'...")
-            installer.install()
-            console.print(f":thumbs_up:\t'{name}' version {installer.version} is installed")
+    for name in names:
+        install(name, os, arch, dry_run)
+
+
+def install(name: str, os: str, arch: str, dry_run: bool, progress: Progress | None = None):
+    installer = manager.get_installer(name, os, arch)
+    logging.debug(f"'{installer.name}' was found with version '{installer.version}'")
+
+    if not dry_run:
+        logging.info(f"Installing '{installer.name}'...")
+        with span("installer.install", tool=installer.name, version=installer.version):
+            installer.install(progress)
+        console.print(f":thumbs_up:\t'{installer.name}' version {installer.version} is installed")
+
+
+def install_tools_concurrently(names: list[str], os: str, arch: str, dry_run: bool, jobs: int):
+    """
+    Every tool runs its whole pipeline (version and installer resolution, download, extraction and copy)
+    on its own worker, so the network wait of one tool overlaps the work of the others.
+    """
+    failures: dict[str, Exception] = {}
+
+    with Progress(console=console) as progress, ThreadPoolExecutor(max_workers=jobs) as executor:
+        task = progress.add_task("Installing...", total=len(names))
+        futures = {executor.submit(install, name, os, arch, dry_run, progress): name for name in names}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as ex:
+                failures[futures[future]] = ex
+            progress.advance(task)
+
+    for name, ex in failures.items():
+        console.print(f":no_entry_sign:\t'{name}' could not be installed: {ex}")
+    if failures:
+        raise Exit(code=1)
 
 
 @app.command("uninstall", help="Uninstall a tool")
@@ -110,8 +195,9 @@ def uninstall_tool(
         logging.info(f"Uninstalling '{name}'...")
 
         if not dry_run:
-            _, path = get_local_version(manager.get_tool(name))
+            path = get_local_path(manager.get_tool(name))
             path.unlink()
+            path_index.invalidate(path.parent)
             console.print(f":thumbs_up:\t'{name}' is uninstalled")
 
 
@@ -129,6 +215,84 @@ def get_status(name: str):
     console.print(f":thumbs_up:\tYou have the latest version of '{name}' ({local_version})")
 
 
+@app.command("outdated", help="List the installed tools that have a newer version")
+def outdated(
+    output_json: bool = Option(False, "--json", help="Print the outdated tools as JSON"),
+    jobs: int = Option(MAX_WORKERS, "--jobs", "-j", min=1, help="Number of tools to probe concurrently"),
+):
+    stale, failures = get_outdated_tools([tool.name for tool in manager.get_tools() if is_tool_available(tool)], jobs)
+
+    if output_json:
+        console.print_json(
+            data=[
+                {"name": name, "current": local_version, "latest": latest_version}
+                for name, (local_version, latest_version) in stale.items()
+            ]
+        )
+    elif stale:
+        table = Table(title="Outdated tools", header_style="bold magenta")
+        table.add_column("Name", style="bold")
+        table.add_column("Current")
+        table.add_column("Latest")
+        for name, (local_version, latest_version) in stale.items():
+            table.add_row(name, local_version, latest_version)
+        console.print(table)
+    elif not failures:
+        console.print(":thumbs_up:\tAll the installed tools are up to date")
+
+    report_status_failures(failures)
+
+
+@app.command("upgrade", help="Install the latest version of outdated tools")
+def upgrade(
+    names: Annotated[list[str], Argument(help="Tools to upgrade, use --all for all the installed tools")] = None,
+    upgrade_all: bool = Option(False, "--all", help="Upgrade all the outdated tools"),
+    os: str = Option(get_host_operating_system()),
+    arch: str = Option(get_host_architecture()),
+    dry_run: bool = Option(False, envvar="DRY_RUN"),
+    jobs: int = Option(MAX_WORKERS, "--jobs", "-j", min=1, help="Number of tools to upgrade concurrently"),
+):
+    if upgrade_all:
+        names = [tool.name for tool in manager.get_tools() if is_tool_available(tool)]
+    elif not names:
+        raise BadParameter("Either tool names or --all are required")
+
+    stale, failures = get_outdated_tools(names, jobs)
+    if not stale and not failures:
+        console.print(":thumbs_up:\tAll the tools are up to date")
+        return
+
+    # The latest versions were already resolved, so the installers don't look them up again
+    specs = [f"{name}@{latest_version}" for name, (_, latest_version) in stale.items()]
+    if len(specs) > 1 and jobs > 1:
+        install_tools_concurrently(specs, os, arch, dry_run, jobs)
+    else:
+        for spec in specs:
+            install(spec, os, arch, dry_run)
+
+    report_status_failures(failures)
+
+
+def get_outdated_tools(names: list[str], jobs: int) -> tuple[dict[str, tuple[str, str]], dict[str, Exception]]:
+    """The local and latest versions of the installed tools that are outdated, by name, and the tools that failed"""
+    statuses, failures = manager.get_statuses(names, jobs)
+    stale = {
+        name: (local_version, latest_version)
+        for name, (exists, is_latest, local_version, _, latest_version) in statuses.items()
+        if exists and not is_latest
+    }
+    return stale, failures
+
+
+def report_status_failures(failures: dict[str, Exception]):
+    # Printed to stderr, so they don't mix with the output of the command (e.g. `outdated --json`)
+    stderr = Console(stderr=True)
+    for name, ex in failures.items():
+        stderr.print(f":no_entry_sign:\t'{name}' could not be checked: {ex}")
+    if failures:
+        raise Exit(code=1)
+
+
 @app.command("show", help="Print information about the supported tool")
 def show(name: str):
     exists, is_latest, local_version, path, latest_version = manager.get_status(name)
@@ -142,18 +306,153 @@ def show(name: str):
     console.print(f"Remote Version: {latest_version}")
 
 
+@cache_app.command("info", help="List the cached artifacts")
+def cache_info():
+    table = Table(title="Mercado cache", header_style="bold magenta")
+    table.add_column("URL", style="bold")
+    table.add_column("Size")
+    table.add_column("Last Used")
+    table.add_column("Digest")
+
+    for artifact in sorted(artifact_store.list_artifacts(), key=lambda item: item.last_used, reverse=True):
+        table.add_row(
+            artifact.url,
+            naturalsize(artifact.size),
+            naturaltime(datetime.fromtimestamp(artifact.last_used)),
+            artifact.digest[:12],
+        )
+
+    console.print(table)
+    console.print(f"Total: {naturalsize(artifact_store.size())} (max: {naturalsize(artifact_store.max_size)})")
+
+
+@cache_app.command("prune", help="Evict the least recently used artifacts")
+def cache_prune(
+    max_size: int = Option(None, help="Size in bytes to shrink the cache to, defaults to the cache size limit"),
+    prune_all: bool = Option(False, "--all", help="Evict all the artifacts"),
+):
+    if prune_all:
+        max_size = 0
+    elif max_size is None:
+        max_size = artifact_store.max_size
+
+    evicted = artifact_store.prune(max_size)
+    console.print(f":thumbs_up:\t{len(evicted)} artifacts were evicted")
+
+
+@cache_app.command("warm", help="Download the artifacts of tools into the cache without installing them")
+def cache_warm(
+    names: list[str],
+    os: str = Option(get_host_operating_system()),
+    arch: str = Option(get_host_architecture()),
+):
+    for name in names:
+        # Checked before the version is resolved, which may cost a request
+        if not manager.supports_cache(name):
+            console.print(f":no_entry_sign:\t'{name}' is installed by a script and cannot be cached")
+            continue
+
+        installer = manager.get_installer(name, os, arch)
+        installer.cache()
+        console.print(f":thumbs_up:\t'{name}' version {installer.version} is cached")
+
+
 def init_logger(default_level: int = logging.INFO):
     loglevel = environ.get("LOGLEVEL", logging.getLevelName(default_level)).upper()
-    logging.basicConfig(level=loglevel, format="%(message)s", handlers=[RichHandler(show_level=False, show_path=False)])
+    logging.basicConfig(
+        level=loglevel,
+        format="%(message)s",
+        handlers=[RichHandler(console=console, show_level=False, show_path=False)],
+    )
+
+
+def report_timings(tracer: Tracer, timings: bool, trace_file: Path | None):
+    if trace_file:
+        tracer.write_chrome_trace(trace_file)
+        logging.info(f"The trace was written to {trace_file}, open it in chrome://tracing or https://ui.perfetto.dev")
+
+    if timings:
+        table = Table(title="Timings", header_style="bold magenta")
+        table.add_column("Phase", style="bold")
+        table.add_column("Calls", justify="right")
+        table.add_column("Total", justify="right")
+        table.add_column("Max", justify="right")
+        for name, calls, total, longest in tracer.summary():
+            table.add_row(name, str(calls), f"{total:.3f}s", f"{longest:.3f}s")
+        # Timings go to stderr, so they don't mix with the output of the command (e.g. `outdated --json`)
+        Console(stderr=True).print(table)
+
+
+def report_profile(profiler: Profiler):
+    profiler.stop()
+    # Like the timings, the profile goes to stderr
+    stderr = Console(stderr=True)
+
+    if profiler.cpu:
+        table = Table(title="Functions by cumulative time", header_style="bold magenta")
+        table.add_column("Function", style="bold")
+        table.add_column("Calls", justify="right")
+        table.add_column("Own", justify="right")
+        table.add_column("Cumulative", justify="right")
+        for name, calls, own, cumulative in profiler.top_functions():
+            table.add_row(name, str(calls), f"{own:.3f}s", f"{cumulative:.3f}s")
+        stderr.print(table)
+        logging.info(f"The profile was written to {profiler.profile_path}, open it with python -m pstats or snakeviz")
+
+    if profiler.memory:
+        table = Table(title=f"Allocations (peak {naturalsize(profiler.peak_memory)})", header_style="bold magenta")
+        table.add_column("Line", style="bold")
+        table.add_column("Size", justify="right")
+        table.add_column("Blocks", justify="right")
+        for line, size, count in profiler.top_allocations():
+            table.add_row(line, naturalsize(size), str(count))
+        stderr.print(table)
+        logging.info(f"The memory snapshot was written to {profiler.snapshot_path}, load it with tracemalloc")
+
+    # The command is profiled from the callback, after the imports, so startup is measured apart
+    packages = import_times()
+    table = Table(title="Import time", header_style="bold magenta")
+    table.add_column("Package", style="bold")
+    table.add_column("Modules", justify="right")
+    table.add_column("Time", justify="right")
+    rows = packages[:PROFILE_TOP] + [item for item in packages[PROFILE_TOP:] if item[0] in DEPENDENCIES]
+    for package, modules, duration in rows:
+        table.add_row(package, str(modules), f"{duration:.3f}s")
+    table.add_section()
+    table.add_row("total", str(sum(item[1] for item in packages)), f"{sum(item[2] for item in packages):.3f}s")
+    stderr.print(table)
 
 
 @app.callback()
-def cli_logging(ctx: Context):
-    if ctx.invoked_subcommand in ("show", "is-latest"):
+def cli_logging(
+    ctx: Context,
+    timings: bool = Option(False, "--timings", help="Print how long every phase of the command took"),
+    trace_file: Path = Option(
+        None, "--trace-file", dir_okay=False, help="Write the phases of the command to a Chrome trace-event JSON file"
+    ),
+    profile: ProfileMode = Option(
+        None, envvar="MERCADO_PROFILE", help="Profile the command with cProfile (cpu) and/or tracemalloc (memory)"
+    ),
+    profile_dir: Path = Option(
+        Path("."), envvar="MERCADO_PROFILE_DIR", file_okay=False, help="Directory of the .prof and .snapshot files"
+    ),
+):
+    if ctx.invoked_subcommand in ("show", "is-latest", "outdated"):
         init_logger(logging.ERROR)
     else:
         init_logger(logging.INFO)
 
+    # Spans are only recorded when asked for, the command runs within a span of its own
+    if timings or trace_file:
+        tracer = enable_tracing()
+        ctx.call_on_close(lambda: report_timings(tracer, timings, trace_file))
+        ctx.with_resource(span(f"command.{ctx.invoked_subcommand}"))
+
+    if profile:
+        profiler = Profiler(profile, profile_dir, ctx.invoked_subcommand)
+        profiler.start()
+        ctx.call_on_close(lambda: report_profile(profiler))
+
 
 def main():
     try:
@@ -161,3 +460,5 @@ def main():
     except ValueError as ex:
         console.print(f":no_entry_sign:\t{ex}")
         exit(1)
+    finally:
+        log_session_stats()
@@ -0,0 +1,447 @@
+import fcntl
+import json
+import logging
+import os
+import time
+from _hashlib import HASH
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import cache, partial
+from hashlib import file_digest, sha256
+from http import HTTPStatus
+from os import environ
+from os.path import basename
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Lock
+from typing import BinaryIO, Callable, Iterator
+from urllib.parse import urlparse
+
+from humanize import naturalsize
+from requests import Response
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
+from rich.progress import Progress
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+from .cache import artifact_store, write_atomic
+from .tracing import span
+from .utils import (
+    DOWNLOADS_DIR,
+    STREAM_MAX_TIMEOUT,
+    extract_file_from_archive,
+    extract_file_from_dmg,
+    get_session,
+    install_file,
+    install_symlink,
+    is_archive,
+    is_dmg,
+)
+
+# Reads start small so tiny artifacts don't allocate much, and double while the connection keeps filling the buffer
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+PROGRESS_REFRESH_INTERVAL = 0.1
+RESUME_ATTEMPTS = 5
+RESUME_BACKOFF_FACTOR = 1
+TRANSFER_ERRORS = (ConnectionError, Timeout, ChunkedEncodingError, ProtocolError, ReadTimeoutError)
+
+# Artifacts from this size are split into byte ranges fetched over several connections,
+# the number of connections can be tuned per host with MERCADO_DOWNLOAD_CONNECTIONS_PER_HOST,
+# e.g. "objects.githubusercontent.com=8,example.com=1"
+SEGMENTED_DOWNLOAD_THRESHOLD = int(environ.get("MERCADO_SEGMENTED_DOWNLOAD_THRESHOLD", 32 * 1024 * 1024))
+DOWNLOAD_CONNECTIONS = int(environ.get("MERCADO_DOWNLOAD_CONNECTIONS", 4))
+
+
+def download_url(name: str, url: str, dest: Path, progress: Progress | None = None, checksum: str = ""):
+    dest.parent.mkdir(exist_ok=True, parents=True)
+
+    logging.debug(f"Download {url}")
+
+    with staged_artifact(name, url, progress, checksum) as temp_file:
+        should_link = False
+        if is_archive(str(temp_file)):
+            temp_file = extract_file_from_archive(temp_file, name)
+
+        if is_dmg(str(temp_file)):
+            temp_file, should_link = extract_file_from_dmg(temp_file, name)
+
+        if should_link:
+            logging.info(f"Linking {temp_file} to {dest}")
+            install_symlink(temp_file, dest)
+        else:
+            logging.info(f"Installing {temp_file} to {dest}")
+            install_file(temp_file, dest)
+
+
+def cache_artifact(name: str, url: str, progress: Progress | None = None, checksum: str = ""):
+    """Download the artifact into the artifact store without installing it"""
+    if (artifact := artifact_store.get(url)) and (not checksum or artifact.digest == checksum):
+        logging.info(f"The artifact of '{name}' is already cached")
+        return
+
+    with staged_artifact(name, url, progress, checksum):
+        pass
+
+
+@contextmanager
+def staged_artifact(name: str, url: str, progress: Progress | None = None, checksum: str = "") -> Iterator[Path]:
+    """
+    The artifact of url, linked from the artifact store or downloaded (and then stored), in a staging directory.
+    Every artifact is staged in its own directory, so concurrent installs never share a path.
+    The sha256 digest is computed while downloading and compared to the checksum when one is published.
+    Stored artifacts are named by their digest, so a cache hit is verified without hashing it again.
+    Concurrent downloads of the same url (e.g. several installs sharing MERCADO_CACHE_DIR) wait for the first one,
+    which then stores the artifact for the others.
+    """
+    DOWNLOADS_DIR.mkdir(exist_ok=True, parents=True)
+
+    with TemporaryDirectory(prefix=f"mercado-{name}-", dir=DOWNLOADS_DIR) as staging_dir, ExitStack() as stack:
+        temp_file = Path(staging_dir) / basename(url)
+
+        with claim_download(name, url):
+            if artifact_store.link(url, temp_file, checksum):
+                logging.info(f"Using the cached artifact of '{name}'")
+            else:
+                if progress is None:
+                    progress = stack.enter_context(Progress())
+
+                task = progress.add_task(f"Downloading {name}...", total=None)
+                with span("download", tool=name, url=url):
+                    digest = _download_resumable(
+                        name,
+                        url,
+                        temp_file,
+                        lambda completed, total: progress.update(task, completed=completed, total=total or None),
+                    )
+
+                if checksum:
+                    if digest != checksum:
+                        raise ValueError(f"The checksum of '{name}' is {digest} while {checksum} was expected")
+                    logging.info(f"The checksum of '{name}' was verified")
+
+                artifact_store.add(url, temp_file, digest)
+
+        yield temp_file
+
+
+def download_resumable(name: str, url: str, dest: Path, on_progress: Callable[[int, int], None]) -> str:
+    """
+    Download into a partial file kept in DOWNLOADS_DIR and move it to dest once it is complete.
+    A download that was interrupted, in this process or a previous one, continues with a Range request
+    as long as the server still has the same version of the artifact (checked with If-Range).
+    Returns the sha256 digest of the artifact, which is computed over the chunks as they are written.
+    """
+    with claim_download(name, url):
+        return _download_resumable(name, url, dest, on_progress)
+
+
+def _download_resumable(name: str, url: str, dest: Path, on_progress: Callable[[int, int], None]) -> str:
+    """download_resumable within the claim on the partial files of url"""
+    partial_file, meta_file, _ = _get_partial_paths(url)
+
+    for attempt in range(RESUME_ATTEMPTS):
+        meta = _load_partial_meta(meta_file, url)
+        # Segments of a segmented download complete out of order, so its partial file can't be resumed
+        resumable = meta and not meta.get("segmented") and partial_file.exists()
+        offset = partial_file.stat().st_size if resumable else 0
+
+        headers = {}
+        if offset and meta["validator"]:
+            headers = {"Range": f"bytes={offset}-", "If-Range": meta["validator"]}
+
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # Hash objects can't be persisted, so the part that was downloaded before is hashed again,
+                # while the request is on its way rather than after it
+                prefix = executor.submit(hash_file, partial_file) if headers else None
+
+                with get_session().get(url, stream=True, headers=headers, timeout=STREAM_MAX_TIMEOUT) as r:
+                    if (
+                        r.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.value
+                        and offset
+                        and offset == meta["size"]
+                    ):
+                        logging.debug(f"{partial_file} is already complete")
+                        hasher, hashed = prefix.result(), offset
+                        break
+                    r.raise_for_status()
+
+                    if r.status_code == HTTPStatus.PARTIAL_CONTENT.value:
+                        logging.info(f"Resuming the download of '{name}' from {naturalsize(offset)}")
+                        hasher = prefix.result()
+                    else:
+                        # The server sent the whole artifact, either because it does not support ranges or it changed
+                        offset = 0
+                        size = int(r.headers.get("content-length", 0))
+                        meta = {"url": url, "validator": _get_validator(r), "size": size}
+                        write_atomic(meta_file, json.dumps(meta).encode())
+                        logging.info(f"Downloading '{name}' to {dest} (size: {naturalsize(meta['size'])})")
+
+                        hasher = sha256()
+
+                        if connections := _get_segments_count(url, r, meta):
+                            meta["segmented"] = True
+                            write_atomic(meta_file, json.dumps(meta).encode())
+                            download_segmented(
+                                r, url, partial_file, meta["size"], meta["validator"], connections, on_progress, hasher
+                            )
+                            hashed = meta["size"]
+                            break
+
+                    with partial_file.open("ab" if offset else "wb") as file:
+                        completed = stream_to_file(
+                            r, file, lambda completed: on_progress(offset + completed, meta["size"]), hasher
+                        )
+                    hashed = offset + completed
+                    break
+        except TRANSFER_ERRORS as ex:
+            if attempt == RESUME_ATTEMPTS - 1:
+                raise
+            logging.warning(f"The download of '{name}' was interrupted ({ex}), resuming it")
+            time.sleep(RESUME_BACKOFF_FACTOR * 2**attempt)
+
+    # The digest is only the one of the artifact if the file holds exactly the bytes that were hashed
+    if (size := partial_file.stat().st_size) != hashed:
+        partial_file.unlink()
+        meta_file.unlink(missing_ok=True)
+        raise ValueError(
+            f"The download of '{name}' is {naturalsize(size)} while {naturalsize(hashed)} were verified, "
+            "please try again"
+        )
+
+    os.replace(partial_file, dest)
+    meta_file.unlink(missing_ok=True)
+    return hasher.hexdigest()
+
+
+@contextmanager
+def claim_download(name: str, url: str) -> Iterator[None]:
+    """
+    Exclusive claim on the partial files of url, between the threads and processes sharing DOWNLOADS_DIR,
+    as an flock on a lock file next to them. The owner removes the lock file once it is done,
+    so a claim that was taken on a removed lock file is taken again on the current one.
+    """
+    _, _, lock_file = _get_partial_paths(url)
+    while True:
+        fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.info(f"Waiting for another download of '{name}'")
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+        try:
+            if os.fstat(fd).st_ino == os.stat(lock_file).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+    try:
+        yield
+    finally:
+        lock_file.unlink(missing_ok=True)
+        os.close(fd)
+
+
+def download_segmented(
+    response: Response,
+    url: str,
+    path: Path,
+    size: int,
+    validator: str,
+    connections: int,
+    on_progress: Callable[[int, int], None],
+    hasher: HASH,
+):
+    """
+    Split the artifact into byte ranges that are fetched concurrently and written in place into a preallocated file.
+    The response that is already open is used for the first range, so it doesn't cost another request.
+    The hasher is fed the contiguous prefix of the file as the segments complete, while it is still in the page cache,
+    so the artifact isn't read again once it was downloaded.
+    """
+    segment_size = -(-size // connections)
+    segments = [(start, min(start + segment_size, size)) for start in range(0, size, segment_size)]
+    logging.debug(f"Downloading {url} in {len(segments)} segments of {naturalsize(segment_size)}")
+
+    completed = [0] * len(segments)
+    lock = Lock()
+    hashed = 0
+    hashing = Lock()
+
+    def get_prefix_end() -> int:
+        for (start, end), segment_completed in zip(segments, completed):
+            if start + segment_completed < end:
+                return start + segment_completed
+        return size
+
+    def hash_prefix(fd: int, blocking: bool = False):
+        nonlocal hashed
+        # A single thread hashes at a time, the others keep downloading and their part is hashed later on
+        if not hashing.acquire(blocking=blocking):
+            return
+        try:
+            with lock:
+                end = get_prefix_end()
+            while hashed < end:
+                chunk = os.pread(fd, min(MAX_CHUNK_SIZE, end - hashed), hashed)
+                if not chunk:
+                    raise ValueError(f"{path} is shorter than the segments written to it")
+                hasher.update(chunk)
+                hashed += len(chunk)
+        finally:
+            hashing.release()
+
+    def report(index: int, segment_completed: int):
+        with lock:
+            completed[index] = segment_completed
+            on_progress(sum(completed), size)
+        hash_prefix(file.fileno())
+
+    with path.open("w+b") as file, ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        file.truncate(size)
+        futures = [
+            executor.submit(
+                _download_segment,
+                url,
+                file.fileno(),
+                start,
+                end,
+                validator,
+                partial(report, index),
+                response if index == 0 else None,
+            )
+            for index, (start, end) in enumerate(segments)
+        ]
+        for future in futures:
+            future.result()
+        hash_prefix(file.fileno(), blocking=True)
+
+
+def _download_segment(
+    url: str,
+    fd: int,
+    start: int,
+    end: int,
+    validator: str,
+    on_progress: Callable[[int], None],
+    response: Response | None = None,
+):
+    buffer = memoryview(bytearray(MAX_CHUNK_SIZE))
+    position = start
+
+    for attempt in range(RESUME_ATTEMPTS):
+        try:
+            if response is None:
+                headers = {"Range": f"bytes={position}-{end - 1}", "If-Range": validator}
+                response = get_session().get(url, stream=True, headers=headers, timeout=STREAM_MAX_TIMEOUT)
+                if response.status_code != HTTPStatus.PARTIAL_CONTENT.value:
+                    response.close()
+                    raise ValueError(f"{url} changed while it was downloaded, please try again")
+
+            with response:
+                response.raw.decode_content = True
+                while position < end:
+                    size = response.raw.readinto(buffer[: min(MAX_CHUNK_SIZE, end - position)])
+                    if not size:
+                        raise ProtocolError(f"The segment {start}-{end} of {url} ended at {position}")
+                    os.pwrite(fd, buffer[:size], position)
+                    position += size
+                    on_progress(position - start)
+            return
+        except TRANSFER_ERRORS as ex:
+            if attempt == RESUME_ATTEMPTS - 1:
+                raise
+            logging.debug(f"The segment {start}-{end} of {url} was interrupted ({ex}), resuming it")
+            response = None
+            time.sleep(RESUME_BACKOFF_FACTOR * 2**attempt)
+
+
+def _get_segments_count(url: str, response: Response, meta: dict) -> int:
+    """Number of connections to download the artifact with, or 0 when it should be a single stream"""
+    connections = get_download_connections(url)
+    if (
+        connections > 1
+        and meta["size"] >= SEGMENTED_DOWNLOAD_THRESHOLD
+        and meta["validator"]
+        and response.headers.get("Accept-Ranges") == "bytes"
+        and not response.headers.get("Content-Encoding")
+    ):
+        return connections
+    return 0
+
+
+def get_download_connections(url: str) -> int:
+    return _get_connections_per_host().get(urlparse(url).hostname, DOWNLOAD_CONNECTIONS)
+
+
+@cache
+def _get_connections_per_host() -> dict[str, int]:
+    """Parse MERCADO_DOWNLOAD_CONNECTIONS_PER_HOST 'host=connections' pairs separated by commas"""
+    connections = {}
+    for item in filter(None, environ.get("MERCADO_DOWNLOAD_CONNECTIONS_PER_HOST", "").split(",")):
+        host, _, count = item.partition("=")
+        connections[host.strip()] = int(count)
+    return connections
+
+
+def _get_partial_paths(url: str) -> tuple[Path, Path, Path]:
+    """The partial file, its metadata and the lock file claiming them"""
+    key = sha256(url.encode()).hexdigest()
+    return DOWNLOADS_DIR / f"{key}.part", DOWNLOADS_DIR / f"{key}.json", DOWNLOADS_DIR / f"{key}.lock"
+
+
+def _load_partial_meta(path: Path, url: str) -> dict | None:
+    try:
+        meta = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("url") == url else None
+
+
+def _get_validator(response: Response) -> str:
+    """If-Range only accepts a strong ETag or a Last-Modified date"""
+    etag = response.headers.get("ETag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified", "")
+
+
+def stream_to_file(
+    response: Response,
+    file: BinaryIO,
+    on_progress: Callable[[int], None],
+    hasher: HASH | None = None,
+) -> int:
+    """
+    Read the response body straight into a preallocated buffer and write it to the file.
+    Every chunk is also fed to the hasher, if any, so the digest doesn't require reading the file again.
+    The progress callback is called at most every PROGRESS_REFRESH_INTERVAL seconds and once at the end.
+    """
+    buffer = memoryview(bytearray(MAX_CHUNK_SIZE))
+    chunk_size = MIN_CHUNK_SIZE
+    completed = 0
+    last_refresh = time.monotonic()
+
+    # Reading the raw stream skips requests' per-chunk generator, the content encoding is still decoded
+    response.raw.decode_content = True
+    while size := response.raw.readinto(buffer[:chunk_size]):
+        file.write(buffer[:size])
+        if hasher:
+            hasher.update(buffer[:size])
+        completed += size
+
+        if size == chunk_size:
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+
+        if (now := time.monotonic()) - last_refresh >= PROGRESS_REFRESH_INTERVAL:
+            on_progress(completed)
+            last_refresh = now
+
+    on_progress(completed)
+    return completed
+
+
+def hash_file(path: Path) -> HASH:
+    with path.open("rb") as file:
+        return file_digest(file, "sha256")
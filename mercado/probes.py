@@ -0,0 +1,70 @@
+import logging
+import subprocess
+from os import X_OK, access, environ
+from pathlib import Path
+
+from .cache import disk_cache
+from .tracing import span
+from .utils import get_local_path, search_version
+from .vendors.vendor import Tool
+
+# Arguments that print the version of most tools, tried in order when a tool didn't declare or learn its own
+DEFAULT_VERSION_PROBES: tuple[tuple[str, ...], ...] = (("--version",), ("version",))
+# Printing the version is immediate, a binary that takes longer is doing something else (e.g. reaching a server)
+VERSION_PROBE_TIMEOUT = float(environ.get("MERCADO_VERSION_PROBE_TIMEOUT", 5))
+VERSION_CACHE_TTL = 30 * 24 * 60 * 60
+
+
+def get_local_version(tool: Tool) -> tuple[str, Path]:
+    path = get_local_path(tool)
+    return get_tool_version(path, tool.version_args), path
+
+
+def get_tool_version(path: Path, version_args: tuple[str, ...] = ()) -> str:
+    """
+    Probe the version of the binary with the declared version_args, the probe that worked for it before or the defaults.
+    The version is cached by the identity of the binary file (inode, mtime and size),
+    so the binary is only run again once it was replaced.
+    """
+    stat = path.stat()
+    if not path.is_file() or not access(path, X_OK):
+        raise FileNotFoundError(path)
+
+    signature = [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+    version_key = f"tool-version:{path}"
+    if (cached := disk_cache.get(version_key, VERSION_CACHE_TTL)) and cached["signature"] == signature:
+        return cached["version"]
+
+    probe_key = f"version-probe:{path.name}"
+    learned_args = tuple(disk_cache.get(probe_key, VERSION_CACHE_TTL) or ())
+    probes = list(dict.fromkeys(filter(None, (tuple(version_args), learned_args, *DEFAULT_VERSION_PROBES))))
+
+    for args in probes:
+        try:
+            version = get_command_version([str(path), *args])
+        except RuntimeError as ex:
+            logging.debug(ex)
+            continue
+
+        if args != learned_args:
+            disk_cache.set(probe_key, args)
+        disk_cache.set(version_key, {"signature": signature, "version": version})
+        return version
+    raise ValueError(path)
+
+
+def get_command_version(args: list[str]) -> str:
+    command = " ".join(args)
+    try:
+        with span("probe.version", command=command):
+            res = subprocess.run(
+                args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=VERSION_PROBE_TIMEOUT, check=False
+            )
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"{command} did not finish within {VERSION_PROBE_TIMEOUT} seconds")
+
+    output = res.stdout.decode(errors="replace").strip()
+    try:
+        return search_version(output)
+    except ValueError:
+        raise RuntimeError(f"Could not find a valid version for {command}")
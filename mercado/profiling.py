@@ -0,0 +1,170 @@
+import cProfile
+import logging
+import os
+import pstats
+import subprocess
+import sys
+import threading
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from enum import StrEnum, auto
+from pathlib import Path
+from typing import Iterable
+
+# Number of rows of every profiling summary
+PROFILE_TOP = int(os.environ.get("MERCADO_PROFILE_TOP", 15))
+
+# The dependencies of the CLI, listed in the import times even when they are not among the slowest packages
+DEPENDENCIES = ["rich", "requests", "typer", "humanize"]
+
+# Frames of tracemalloc itself would otherwise show up in the allocations of the command
+MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+]
+
+
+class ProfileMode(StrEnum):
+    CPU = auto()
+    MEMORY = auto()
+    ALL = auto()
+
+
+class Profiler:
+    """
+    Profiles a command with cProfile (cpu) and/or tracemalloc (memory), from start() to stop().
+    cProfile only follows the thread it was enabled in, so threads started meanwhile get profilers of their own,
+    which are merged into the stats of the command (Python 3.12+ profiles all the threads with a single one).
+    """
+
+    def __init__(self, mode: ProfileMode, directory: Path, command: str):
+        self.cpu = mode in (ProfileMode.CPU, ProfileMode.ALL)
+        self.memory = mode in (ProfileMode.MEMORY, ProfileMode.ALL)
+        self.prefix = directory / f"mercado-{command}-{datetime.now():%Y%m%d-%H%M%S}"
+        self._profile = cProfile.Profile()
+        self._thread_profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self.stats: pstats.Stats | None = None
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self.peak_memory = 0
+
+    @property
+    def profile_path(self) -> Path:
+        return self.prefix.with_suffix(".prof")
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.prefix.with_suffix(".snapshot")
+
+    def _profile_thread(self, *_):
+        # Called on the first event of every new thread, the profiler then replaces this hook within the thread
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if self.memory:
+            tracemalloc.start()
+        if self.cpu:
+            if sys.version_info < (3, 12):
+                threading.setprofile(self._profile_thread)
+            self._profile.enable()
+
+    def stop(self):
+        """Stop profiling and write the .prof (pstats) and .snapshot (tracemalloc) files"""
+        self.prefix.parent.mkdir(parents=True, exist_ok=True)
+        # Both are stopped before either result is collected, so they don't measure each other
+        if self.cpu:
+            self._profile.disable()
+            threading.setprofile(None)
+
+        if self.memory:
+            self.snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+            _, self.peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.snapshot.dump(str(self.snapshot_path))
+
+        if self.cpu:
+            self.stats = pstats.Stats(self._profile)
+            with self._lock:
+                for profile in self._thread_profiles:
+                    self.stats.add(profile)
+            self.stats.dump_stats(self.profile_path)
+
+    def top_functions(self, limit: int = PROFILE_TOP) -> list[tuple[str, int, float, float]]:
+        """The calls, own and cumulative time (in seconds) of the functions, by cumulative time"""
+        if self.stats is None:
+            return []
+
+        functions = [
+            (describe_function(*function), calls, own, cumulative)
+            for function, (_, calls, own, cumulative, _) in self.stats.stats.items()
+        ]
+        return sorted(functions, key=lambda item: item[3], reverse=True)[:limit]
+
+    def top_allocations(self, limit: int = PROFILE_TOP) -> list[tuple[str, int, int]]:
+        """The size and number of the memory blocks still allocated at the end of the command, by source line"""
+        if self.snapshot is None:
+            return []
+
+        return [
+            (f"{short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}", stat.size, stat.count)
+            for stat in self.snapshot.statistics("lineno")[:limit]
+        ]
+
+
+def describe_function(filename: str, line: int, name: str) -> str:
+    if filename == "~":
+        # Builtins, e.g. "<method 'read' of '_ssl._SSLSocket' objects>"
+        return name
+    return f"{short_path(filename)}:{line}({name})"
+
+
+def short_path(filename: str) -> str:
+    """The path of a module relative to its entry of sys.path, e.g. 'rich/console.py'"""
+    for entry in sorted(filter(None, sys.path), key=len, reverse=True):
+        if filename.startswith(entry + os.sep):
+            return filename[len(entry) + 1 :]
+    return filename
+
+
+def import_times(module: str = "mercado.cli") -> list[tuple[str, int, float]]:
+    """
+    The number of modules and the time (in seconds) it takes to import every top level package,
+    measured by a fresh interpreter (-X importtime), as the running one already imported them.
+    """
+    # The module may only be importable from the path of the running interpreter (e.g. ran from the source tree)
+    env = os.environ | {"PYTHONPATH": os.pathsep.join(filter(None, sys.path))}
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True
+    )
+    if res.returncode != 0:
+        logging.warning(f"Failed to measure the import time of {module}: {res.stderr.splitlines()[-1:]}")
+    return parse_import_times(res.stderr.splitlines())
+
+
+def parse_import_times(lines: Iterable[str]) -> list[tuple[str, int, float]]:
+    """
+    Sums the self time of the modules of every top level package, slowest first, out of -X importtime lines:
+        import time: self [us] | cumulative | imported package
+        import time:       412 |      12150 |   rich.console
+    """
+    modules: dict[str, int] = defaultdict(int)
+    durations: dict[str, int] = defaultdict(int)
+    for line in lines:
+        prefix, _, fields = line.partition(":")
+        if prefix != "import time":
+            continue
+
+        own, _, name = (field.strip() for field in fields.split("|"))
+        if not own.isdigit():
+            continue
+
+        package = name.partition(".")[0]
+        modules[package] += 1
+        durations[package] += int(own)
+
+    packages = [(package, modules[package], duration / 1e6) for package, duration in durations.items()]
+    return sorted(packages, key=lambda item: item[2], reverse=True)
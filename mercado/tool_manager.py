@@ -1,74 +1,215 @@
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
+from threading import Lock
+from typing import Iterable, Iterator
 
+from .probes import get_local_version
 from .tools import TOOLS
-from .utils import get_local_version, is_tool_available
-from .vendors.vendor import Installer, Tool, ToolVendor
+from .tracing import span
+from .utils import MAX_WORKERS, is_tool_available
+from .vendors.github import GitHub, GitHubTool
+from .vendors.shell import ShellTool
+from .vendors.vendor import Installer, Label, Tool, ToolVendor
+from .versions import ReleaseIndex, is_outdated, is_version_constraint, parse_version_constraint
 
 
 class ToolManager:
-    def __init__(self) -> None:
-        self._vendors: dict[ToolVendor, list[Tool]] = TOOLS
-
-    def get_tool(self, name) -> Tool:
+    def __init__(self, tools: dict[type[ToolVendor], list[Tool]] | None = None) -> None:
+        self._tools: dict[type[ToolVendor], list[Tool]] = TOOLS if tools is None else tools
+        self._vendors: dict[type[ToolVendor], ToolVendor] = {}
+        self._lock = Lock()
+
+        # Indexes built once, so looking up a tool by name, alias or label never scans the registered tools
+        self._names: dict[str, tuple[type[ToolVendor], Tool]] = {}
+        self._labels: dict[Label, list[Tool]] = defaultdict(list)
+        self._sorted_tools: list[tuple[str, Tool]] = []
+        self._index_tools()
+
+    def _index_tools(self):
+        for vendor_type, tools in self._tools.items():
+            for tool in tools:
+                for name in (tool.name, *tool.aliases):
+                    if name in self._names:
+                        raise ValueError(f"Tool name '{name}' is registered more than once")
+                    self._names[name] = (vendor_type, tool)
+                self._sorted_tools.append((vendor_type.__name__, tool))
+
+        self._sorted_tools.sort(key=lambda item: item[1].name)
+        for _, tool in self._sorted_tools:
+            for label in tool.labels:
+                self._labels[label].append(tool)
+
+    def _get_vendor(self, vendor_type: type[ToolVendor]) -> ToolVendor:
+        """Vendors are created on first use, so commands that never reach a vendor don't pay for it"""
+        with self._lock:
+            if vendor_type not in self._vendors:
+                self._vendors[vendor_type] = vendor_type()
+            return self._vendors[vendor_type]
+
+    def get_tool(self, name: str) -> Tool:
         _, tool = self._get_tool(name)
         return tool
 
-    def _get_tool(self, name) -> tuple[ToolVendor, Tool]:
-        for vendor, tools in self._vendors.items():
-            for tool in tools:
-                if tool.name == name:
-                    return vendor, tool
-        raise ValueError(f"Tool '{name}' is not supported. Check the full supported tools with 'marcado list'")
+    def _get_tool(self, name: str) -> tuple[ToolVendor, Tool]:
+        name, _ = parse_tool_spec(name)
+        if name not in self._names:
+            raise ValueError(f"Tool '{name}' is not supported. Check the full supported tools with 'marcado list'")
+
+        vendor_type, tool = self._names[name]
+        return self._get_vendor(vendor_type), tool
+
+    def get_tools(self, labels: Iterable[Label] | None = None) -> list[Tool]:
+        """The supported tools sorted by name, only the ones with any of the labels when they are given"""
+        if not labels:
+            return [tool for _, tool in self._sorted_tools]
+
+        labels = set(labels)
+        if len(labels) == 1:
+            return list(self._labels[labels.pop()])
+        # Tools are deduplicated by name, some of them (shell tools) can't be hashed
+        tools = {tool.name: tool for label in labels for tool in self._labels[label]}
+        return [tools[name] for name in sorted(tools)]
 
     def get_supported_tools(self, separate_vendors=False) -> list[tuple[str, list[Tool]]]:
         if not separate_vendors:
-            all_vendors: list[tuple[str, Tool]] = []
-            for vendor, tools in self._vendors.items():
-                for tool in tools:
-                    all_vendors.append((vendor.__class__.__name__, tool))
-            for vendor_name, tool in sorted(all_vendors, key=lambda item: item[1].name):
+            for vendor_name, tool in self._sorted_tools:
                 yield vendor_name, [tool]
         else:
-            for vendor, tools in self._vendors.items():
-                yield vendor.__class__.__name__, sorted(tools, key=lambda tool: tool.name)
+            for vendor_type, tools in self._tools.items():
+                yield vendor_type.__name__, sorted(tools, key=lambda tool: tool.name)
 
     def get_latest_version(self, name: str) -> str:
         vendor, tool = self._get_tool(name)
         return vendor.get_latest_version(tool)
 
-    def get_installer(self, name: str, os: str, arch: str) -> Installer:
-        version = None
-        if "@" in name:
-            version = name.split("@")[1]
-            name = name[: name.index("@")]
+    def prefetch_latest_versions(self, names: list[str]):
+        """
+        Resolve the latest versions of all the GitHub hosted tools with batched queries, later lookups are served from
+        memory. The ones that can't be batched (e.g. without a token) are left to their own, concurrent, lookups.
+        """
+        releases = []
+        for name in names:
+            tool = self.get_tool(name)
+            if isinstance(tool, GitHubTool):
+                releases.append(tool)
+            elif isinstance(tool, ShellTool) and tool.release:
+                releases.append(tool.release)
+
+        if len(releases) > 1:
+            with span("version.prefetch", tools=len(releases)):
+                self._get_vendor(GitHub).prefetch_latest_versions(releases)
+
+    def get_latest_versions(self, names: list[str]) -> dict[str, str]:
+        self.prefetch_latest_versions(names)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            return dict(zip(names, executor.map(self.get_latest_version, names)))
+
+    def resolve_version(self, name: str, constraint: str) -> str:
+        """The newest release of the tool that satisfies the constraint, e.g. '~1.5' or '>=0.20,<0.22'"""
+        vendor, tool = self._get_tool(name)
+        # Tools that are versioned by a GitHub repository are listed from it
+        if release := getattr(tool, "release", None):
+            vendor, tool = self._get_vendor(GitHub), release
 
+        if not vendor.supports_versions:
+            raise ValueError(f"Tool '{name}' does not support version constraints, use an exact version instead")
+
+        key = f"{vendor.__class__.__name__}:{getattr(tool, 'repository', '') or tool.name}"
+        index = ReleaseIndex(key, partial(vendor.get_versions_page, tool))
+        return index.resolve(parse_version_constraint(constraint))
+
+    def get_installer(self, name: str, os: str, arch: str) -> Installer:
+        name, version = parse_tool_spec(name)
         vendor, tool = self._get_tool(name)
         logging.debug(f"'{name}' is available by the '{vendor.__class__.__name__}' vendor")
 
+        if version and is_version_constraint(version):
+            logging.info(f"Looking for the newest version of '{tool.name}' that satisfies {version}")
+            with span("version.resolve", tool=tool.name, constraint=version):
+                version = self.resolve_version(name, version)
+
         if not version:
             logging.info(f"Looking for the latest version of '{tool.name}'")
-            version = vendor.get_latest_version(tool)
+            with span("version.latest", tool=tool.name):
+                version = vendor.get_latest_version(tool)
 
         logging.info(f"Getting installer for tool '{tool.name}' with version {version} for {os} and {arch}")
-        return vendor.get_installer(tool, version, os, arch)
+        with span("installer.resolve", tool=tool.name, version=version):
+            return vendor.get_installer(tool, version, os, arch)
+
+    def supports_cache(self, name: str) -> bool:
+        vendor, _ = self._get_tool(name)
+        return vendor.supports_cache
 
     def is_tool_available(self, name: str) -> bool:
         return is_tool_available(self.get_tool(name))
 
     def get_status(self, name: str) -> tuple[bool, bool, str, Path | None, str]:
-        exists = is_tool_available(self.get_tool(name))
+        vendor, tool = self._get_tool(name)
+        exists = is_tool_available(tool)
         local_version = ""
         path = None
         latest_version = ""
 
         if exists:
-            local_version, path = get_local_version(self.get_tool(name))
-            latest_version = self.get_latest_version(name)
+            with span("version.local", tool=tool.name):
+                local_version, path = get_local_version(tool)
+            with span("version.latest", tool=tool.name):
+                latest_version = vendor.get_latest_version(tool)
 
-        # In is_latest release candidates are ignored
-        is_latest = local_version.split("-rc")[0] in latest_version.split("-rc")[0]
+        is_latest = not exists or not is_outdated(local_version, latest_version)
         return exists, is_latest, local_version, path, latest_version
 
+    def iter_statuses(
+        self, names: list[str], jobs: int = MAX_WORKERS
+    ) -> Iterator[tuple[str, tuple[bool, bool, str, Path | None, str] | None, Exception | None]]:
+        """
+        The statuses of many tools as each one is resolved, concurrently with the latest versions of GitHub tools
+        batched, alongside the error of a tool whose status could not be resolved (e.g. rate limited) so one doesn't
+        fail all
+        """
+        try:
+            self.prefetch_latest_versions([name for name in names if self.is_tool_available(name)])
+        except Exception as ex:
+            # Every tool looks its latest version up on its own, so its error is recorded with its status
+            logging.warning(f"Failed to resolve the latest versions at once ({ex})")
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(self.get_status, name): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    status = future.result()
+                except Exception as ex:
+                    yield futures[future], None, ex
+                else:
+                    yield futures[future], status, None
+
+    def get_statuses(
+        self, names: list[str], jobs: int = MAX_WORKERS
+    ) -> tuple[dict[str, tuple[bool, bool, str, Path | None, str]], dict[str, Exception]]:
+        """The statuses of many tools, and the errors of the tools whose status could not be resolved"""
+        statuses = {}
+        failures: dict[str, Exception] = {}
+        for name, status, error in self.iter_statuses(names, jobs):
+            if error is not None:
+                failures[name] = error
+            else:
+                statuses[name] = status
+
+        # The statuses are kept in the order of the names, rather than the one they completed in
+        return {name: statuses[name] for name in names if name in statuses}, failures
+
+
+def parse_tool_spec(spec: str) -> tuple[str, str]:
+    """
+    Split `name@version` into the name and the version, which is empty when the version isn't pinned.
+    The version may also be a constraint that is resolved to the newest release satisfying it (`terraform@~1.5`).
+    """
+    name, _, version = spec.partition("@")
+    return name, version
+
 
 manager = ToolManager()
@@ -1,15 +1,17 @@
 from os import environ
 from pathlib import Path
 
-from .utils import INSTALL_DIR, PACKAGES_DIR, fetch_url, is_arm64_arch, is_darwin_os, search_version
+from .cache import fetch_url
+from .utils import INSTALL_DIR, PACKAGES_DIR, is_arm64_arch, is_darwin_os, search_version
 from .vendors.github import GitHub, GitHubTool
 from .vendors.hashicorp import Hashicorp
 from .vendors.shell import Shell, ShellTool
 from .vendors.url_fetcher import URLFetcher, URLFetcherTool
 from .vendors.vendor import Label, Tool, ToolVendor
 
-TOOLS: dict[ToolVendor, list[Tool]] = {
-    GitHub(): [
+# Vendors are referenced by type and only instantiated by the ToolManager on first use
+TOOLS: dict[type[ToolVendor], list[Tool]] = {
+    GitHub: [
         GitHubTool("kind", labels=(Label.K8S, Label.DOCKER, Label.ORCHESTRATE), repository="kubernetes-sigs/kind"),
         GitHubTool("gh", labels=(Label.VCS,), repository="cli/cli"),
         GitHubTool("k3d", labels=(Label.K8S, Label.DOCKER, Label.ORCHESTRATE), repository="k3d-io/k3d"),
@@ -27,15 +29,16 @@ TOOLS: dict[ToolVendor, list[Tool]] = {
             "compose",
             labels=(Label.VIRT, Label.DOCKER, Label.ORCHESTRATE),
             repository="docker/compose",
+            aliases=("docker-compose",),
             target=Path(environ.get("DOCKER_CONFIG", Path.home() / ".docker")) / "cli-plugins/docker-compose",
         ),
         GitHubTool("k9s", labels=(Label.K8S,), repository="derailed/k9s"),
         GitHubTool("k8sgpt", labels=(Label.K8S,), repository="k8sgpt-ai/k8sgpt"),
         GitHubTool("colima", labels=(Label.DOCKER,), repository="abiosoft/colima"),
-        GitHubTool("task", labels=(Label.BUILD,), repository="go-task/task"),
+        GitHubTool("task", labels=(Label.BUILD,), repository="go-task/task", aliases=("go-task",)),
         GitHubTool("sops", labels=(Label.SECURITY,), repository="getsops/sops"),
     ],
-    Hashicorp(): [
+    Hashicorp: [
         Tool("vagrant", labels=(Label.VIRT,)),
         Tool("vault", labels=(Label.SECURITY,)),
         Tool("terraform", labels=(Label.IAC,)),
@@ -49,22 +52,26 @@ TOOLS: dict[ToolVendor, list[Tool]] = {
             ),
         ),
     ],
-    URLFetcher(): [
+    URLFetcher: [
         URLFetcherTool(
             "kubectl",
             labels=(Label.K8S,),
+            # Without --client kubectl also asks the cluster for its version
+            version_args=("version", "--client"),
             get_latest_version_url="https://storage.googleapis.com/kubernetes-release/release/stable.txt",
             get_release_by_version_url=lambda os,
             arch,
             version: f"https://storage.googleapis.com/kubernetes-release/release/{version}/bin/{os}/{arch}/kubectl",
+            release=GitHubTool("kubernetes", repository="kubernetes/kubernetes"),
         ),
     ],
-    Shell(): [
+    Shell: [
         ShellTool(
             "helm",
             labels=(Label.K8S,),
+            version_args=("version",),
             env_vars={"USE_SUDO": "false", "HELM_INSTALL_DIR": str(INSTALL_DIR)},
-            get_latest_version=lambda: GitHub().get_latest_version(GitHubTool("helm", repository="helm/helm")),
+            release=GitHubTool("helm", repository="helm/helm"),
             download_script=lambda version, os, arch: f"""
                   curl -fsSL -o get_helm.sh https://raw.githubusercontent.com/helm/helm/main/scripts/get-helm-3
                   chmod 700 get_helm.sh
@@ -74,7 +81,7 @@ TOOLS: dict[ToolVendor, list[Tool]] = {
         ShellTool(
             "docker",
             labels=(Label.VIRT, Label.DOCKER),
-            get_latest_version=lambda: GitHub().get_latest_version(GitHubTool("moby", repository="moby/moby")),
+            release=GitHubTool("moby", repository="moby/moby"),
             download_script=lambda version, os, arch: f"""
                   curl -fsSL https://get.docker.com -o get-docker.sh
                   VERSION={version} sh get-docker.sh
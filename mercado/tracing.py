@@ -0,0 +1,125 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from functools import wraps
+from pathlib import Path
+from threading import Lock, current_thread, get_ident
+from typing import Any, Callable, ContextManager, Iterator
+
+
+@dataclass(frozen=True)
+class Span:
+    name: str
+    start_ns: int
+    duration_ns: int
+    thread_id: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def category(self) -> str:
+        """Spans are named '<category>.<phase>', e.g. 'github.release' or 'extract.archive'"""
+        return self.name.partition(".")[0]
+
+
+class Tracer:
+    """Collects the spans of all the threads of the process, from the moment it was enabled"""
+
+    def __init__(self):
+        self.origin_ns = time.perf_counter_ns()
+        self.spans: list[Span] = []
+        self._threads: dict[int, str] = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[None]:
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            thread_id = get_ident()
+            with self._lock:
+                self.spans.append(Span(name, start - self.origin_ns, duration, thread_id, args))
+                self._threads.setdefault(thread_id, current_thread().name)
+
+    def summary(self) -> list[tuple[str, int, float, float]]:
+        """
+        The number of calls, total and maximal duration (in seconds) of every span name, slowest first.
+        Spans of concurrent threads overlap, so the total of a phase may be longer than the whole command.
+        """
+        durations: dict[str, list[int]] = defaultdict(list)
+        with self._lock:
+            for span in self.spans:
+                durations[span.name].append(span.duration_ns)
+
+        summary = [(name, len(items), sum(items) / 1e9, max(items) / 1e9) for name, items in durations.items()]
+        return sorted(summary, key=lambda item: item[2], reverse=True)
+
+    def to_chrome_trace(self) -> dict:
+        """The spans in the Chrome trace event format, viewable in chrome://tracing or https://ui.perfetto.dev"""
+        pid = os.getpid()
+        with self._lock:
+            events = [
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": name}}
+                for thread_id, name in self._threads.items()
+            ]
+            for span in self.spans:
+                events.append(
+                    {
+                        "name": span.name,
+                        "cat": span.category,
+                        "ph": "X",
+                        "ts": span.start_ns / 1000,
+                        "dur": span.duration_ns / 1000,
+                        "pid": pid,
+                        "tid": span.thread_id,
+                        "args": {key: str(value) for key, value in span.args.items()},
+                    }
+                )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path):
+        path.write_text(json.dumps(self.to_chrome_trace()))
+
+
+# Tracing is disabled unless a command asked for timings, spans are then a single global lookup
+_tracer: Tracer | None = None
+
+
+def enable_tracing() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def disable_tracing() -> Tracer | None:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name: str, **args) -> ContextManager[None]:
+    """Time the block as the span name, args (e.g. the tool or url) are attached to it in the trace"""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.span(name, **args)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Time every call of the decorated function as the span name"""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
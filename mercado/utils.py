@@ -1,36 +1,64 @@
+import fcntl
 import logging
 import platform
 import re
 import stat
 import subprocess
+import sys
+import tarfile
+import time
+from collections import defaultdict
 from contextlib import suppress
 from functools import cache, partial
 from glob import glob
 from http import HTTPStatus
+from os import X_OK, access, environ, fstat, getpid, link, pathsep, rename, replace, scandir
 from os.path import basename
-from pathlib import Path
-from shutil import copy, get_unpack_formats, unpack_archive, which
-from tempfile import gettempdir
-from typing import Callable, Sequence
+from pathlib import Path, PurePosixPath
+from shutil import copyfile, copyfileobj, get_unpack_formats
+from tempfile import TemporaryDirectory
+from threading import Lock, get_ident
+from typing import BinaryIO, Sequence
+from zipfile import ZipFile, is_zipfile
 
 from humanize import naturalsize
-from requests import Session
+from requests import Response, Session
 from requests.adapters import HTTPAdapter
-from rich.progress import Progress
 from urllib3 import Retry
+from urllib3.util import parse_url
 
+from .tracing import traced
 from .vendors.vendor import Tool
 
+try:
+    from os import copy_file_range
+except ImportError:
+    # Only available on Linux
+    copy_file_range = None
+
 MATRIX_X86_64 = ("amd64", "x86_64", "64bit")
 MATRIX_ARM64 = ("arm64", "aarch64")
 MATRIX_MAC = ("darwin", "macos")
 INSTALL_DIR = Path.home() / ".mercado"
 PACKAGES_DIR = INSTALL_DIR / "packages"
+# The cache can be moved, e.g. to a volume that is shared between CI jobs
+CACHE_DIR = Path(environ.get("MERCADO_CACHE_DIR", INSTALL_DIR / "cache"))
+# Downloads are staged and partially downloaded artifacts are kept here, so they can be resumed
+DOWNLOADS_DIR = CACHE_DIR / "downloads"
 PKG_PAYLOAD_FILE = "Payload"
-CHUNK_SIZE = 1024
 REQUEST_MAX_TIMEOUT = 10
 STREAM_MAX_TIMEOUT = 300
-SUBPROCSES_TIMEOUT = 30
+EXTRACT_BUFFER_SIZE = 1024 * 1024
+MAX_WORKERS = int(environ.get("MERCADO_MAX_WORKERS", 8))
+# Number of hosts to keep a connection pool for, and the number of connections kept alive for each host
+POOL_CONNECTIONS = int(environ.get("MERCADO_POOL_CONNECTIONS", 10))
+POOL_MAXSIZE = int(environ.get("MERCADO_POOL_MAXSIZE", MAX_WORKERS))
+# ioctl request that clones a file on Linux, not exposed by the fcntl module before Python 3.12.
+# The request number means something else on other platforms, which copy with shutil (fcopyfile on macOS)
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409) if sys.platform.startswith("linux") else None
+# How long the listings of PATH directories are used before checking whether the directories changed
+PATH_INDEX_INTERVAL = 1.0
+SHA256_PATTERN = re.compile(r"[0-9a-fA-F]{64}")
 SUPPORTED_ARCHIVE_FORMATS: list[str] = sum([format[1] for format in get_unpack_formats()], [])
 
 
@@ -71,37 +99,23 @@ def is_darwin_os(os: str) -> bool:
 
 
 def contains_ignore_case(item: str, lst: Sequence[str]):
-    for element in lst:
-        if re.search(element, item, re.IGNORECASE):
-            return True
+    return bool(_compile_alternatives(tuple(lst)).search(item))
+
 
-    return False
+@cache
+def _compile_alternatives(elements: tuple[str, ...]) -> re.Pattern:
+    return re.compile("|".join(elements), re.IGNORECASE)
 
 
-def get_local_version(tool: Tool) -> tuple[str, Path]:
+def get_local_path(tool: Tool) -> Path:
     if tool.target:
-        path = tool.target
+        path = tool.target if tool.target.exists() else path_index.which(tool.name)
     else:
-        path = default_install_path(tool.name)
+        path = path_index.find(INSTALL_DIR, tool.name) or path_index.which(tool.name)
 
-    if not path.exists():
-        path = which(Path(tool.name))
-        if not path:
-            raise ValueError(f"{tool.name} could not be found")
-        path = Path(path)
-
-    return get_tool_version(path), path
-
-
-def get_command_version(command: str) -> str:
-    res = subprocess.run(
-        command.split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=SUBPROCSES_TIMEOUT, check=False
-    )
-    output = res.stdout.decode().strip()
-    try:
-        return search_version(output)
-    except ValueError:
-        raise RuntimeError(f"Could not find a valid version for {command}")
+    if not path:
+        raise ValueError(f"{tool.name} could not be found")
+    return path
 
 
 def search_version(text: str) -> str:
@@ -114,20 +128,6 @@ def search_version(text: str) -> str:
     raise ValueError("version could not been found in {text}")
 
 
-def get_tool_version(path: Path, silent: bool = False) -> str:
-    if not which(path):
-        raise FileNotFoundError(path)
-
-    commands = [f"{path} --version", f"{path} version"]
-    for command in commands:
-        try:
-            return get_command_version(command)
-        except RuntimeError as ex:
-            if not silent:
-                logging.debug(ex)
-    raise ValueError(path)
-
-
 def default_install_path(name: str) -> Path:
     return INSTALL_DIR / name
 
@@ -139,64 +139,126 @@ def is_tool_available(tool: Tool) -> bool:
 
 
 def is_tool_available_in_path(name: str) -> bool:
-    return which(name) is not None
-
-
-def download_url(name: str, url: str, dest: Path):
-    dest.parent.mkdir(exist_ok=True, parents=True)
+    return path_index.which(name) is not None
+
+
+class PathIndex:
+    """
+    The names of the files in the PATH directories, so looking up many tools lists every directory once
+    instead of checking every directory for every tool like `which`.
+    A directory is listed again when its mtime changed, the mtimes are checked at most every PATH_INDEX_INTERVAL.
+    Only the executable bit of files that are looked up is checked, so listing a directory never stats its files.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # Directory to its mtime and the names of its files, which are mapped to whether they are executable once known
+        self._directories: dict[str, tuple[int, dict[str, bool | None]]] = {}
+        self._validated: dict[str, float] = {}
+
+    def _entries(self, directory: str) -> dict[str, bool | None]:
+        now = time.monotonic()
+        with self._lock:
+            if directory in self._directories and now - self._validated[directory] < PATH_INDEX_INTERVAL:
+                return self._directories[directory][1]
+
+            try:
+                mtime = Path(directory).stat().st_mtime_ns
+            except OSError:
+                mtime, entries = 0, {}
+            else:
+                if directory in self._directories and self._directories[directory][0] == mtime:
+                    entries = self._directories[directory][1]
+                else:
+                    # PATH may name files or directories that can't be listed, they have no executables
+                    entries = {}
+                    with suppress(OSError), scandir(directory) as it:
+                        entries = dict.fromkeys((entry.name for entry in it), None)
+
+            self._directories[directory] = (mtime, entries)
+            self._validated[directory] = now
+            return entries
+
+    def find(self, directory: Path, name: str) -> Path | None:
+        """The executable file named name in directory"""
+        entries = self._entries(str(directory))
+        if name not in entries:
+            return None
+
+        if entries[name] is None:
+            path = Path(directory) / name
+            entries[name] = path.is_file() and access(path, X_OK)
+        return Path(directory) / name if entries[name] else None
+
+    def which(self, name: str) -> Path | None:
+        """The first executable named name in the PATH directories"""
+        for directory in filter(None, environ.get("PATH", "").split(pathsep)):
+            if path := self.find(Path(directory), name):
+                return path
+        return None
+
+    def invalidate(self, directory: Path):
+        """Forget the listing of a directory that was just changed, before its mtime is checked again"""
+        with self._lock:
+            self._directories.pop(str(directory), None)
+            self._validated.pop(str(directory), None)
+
+
+path_index = PathIndex()
 
-    logging.debug(f"Download {url}")
 
-    with create_session().get(url, stream=True, timeout=STREAM_MAX_TIMEOUT) as r:
-        total_length = int(r.headers.get("content-length", 0))
-
-        temp_file = Path(gettempdir()) / basename(url)
+def is_archive(path: str) -> bool:
+    return any(path.endswith(suffix) for suffix in SUPPORTED_ARCHIVE_FORMATS)
 
-        logging.info(f"Downloading '{name}' to {temp_file} (size: {naturalsize(total_length)})")
 
-        with temp_file.open("wb") as file, Progress() as progress:
-            task = progress.add_task("Downloading...", total=total_length)
-            for data in r.iter_content(chunk_size=CHUNK_SIZE):
-                if data:
-                    file.write(data)
-                progress.advance(task, CHUNK_SIZE)
+@traced("extract.archive")
+def extract_file_from_archive(path: Path, file_name: str) -> Path:
+    """Extract only the member named file_name, the rest of the archive (docs, completions...) is never written"""
+    unpack_dest = path.with_suffix("")
+    unpack_dest.mkdir(exist_ok=True)
+    dest = unpack_dest / file_name
+    logging.info(f"Extracting {file_name} from {path} to {dest}")
 
-        should_link = False
-        if is_archive(str(temp_file)):
-            temp_file = extract_file_from_archive(temp_file, name)
+    if is_zipfile(path):
+        return extract_file_from_zip(path, file_name, dest)
 
-        if is_dmg(str(temp_file)):
-            temp_file, should_link = extract_file_from_dmg(temp_file, name)
+    with path.open("rb") as file:
+        return extract_file_from_tar_stream(file, file_name, dest)
 
-        if should_link:
-            logging.info(f"Linking {temp_file} to {dest}")
-            dest.unlink(missing_ok=True)
-            dest.symlink_to(temp_file)
-        else:
-            logging.info(f"Copying {temp_file} to {dest}")
-            copy(temp_file, dest)
 
-        dest.chmod(dest.stat().st_mode | stat.S_IEXEC)
+def extract_file_from_zip(path: Path, file_name: str, dest: Path) -> Path:
+    # The central directory lists all members without reading any of them
+    with ZipFile(path) as archive:
+        matches = [
+            info for info in archive.infolist() if not info.is_dir() and PurePosixPath(info.filename).name == file_name
+        ]
+        assert len(matches) == 1, f"There should be one file in the archive with the name {file_name}"
 
+        with archive.open(matches[0]) as source, dest.open("wb") as target:
+            copyfileobj(source, target, EXTRACT_BUFFER_SIZE)
+    return dest
 
-def is_archive(path: str) -> bool:
-    return any(path.endswith(suffix) for suffix in SUPPORTED_ARCHIVE_FORMATS)
 
+def extract_file_from_tar_stream(file: BinaryIO, file_name: str, dest: Path) -> Path:
+    """
+    Read the (possibly compressed) tar stream header by header and stop at the first member named file_name.
+    The stream is read once and never seeked, so it can be a file or an HTTP response.
+    """
+    with tarfile.open(fileobj=file, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and PurePosixPath(member.name).name == file_name:
+                with archive.extractfile(member) as source, dest.open("wb") as target:
+                    copyfileobj(source, target, EXTRACT_BUFFER_SIZE)
+                return dest
 
-def extract_file_from_archive(path: Path, file_name: str) -> Path:
-    unpack_dest = path.with_suffix("")
-    unpack_dest.mkdir(exist_ok=True)
-    logging.info(f"Unpacking {path} to {unpack_dest}")
-    unpack_archive(path, extract_dir=unpack_dest)
-    matches = glob(f"{unpack_dest}/**/{file_name}", recursive=True)
-    assert len(matches) == 1, f"There should be one file in the archive with the name {file_name}"
-    return Path(matches[0])
+    raise ValueError(f"There should be one file in the archive with the name {file_name}")
 
 
 def is_dmg(path: str) -> bool:
     return path.endswith(".dmg")
 
 
+@traced("extract.dmg")
 def extract_file_from_dmg(path: Path, file_name: str) -> (Path, bool):
     unpack_dest = path.with_suffix("")
     unpack_dest.mkdir(exist_ok=True)
@@ -223,29 +285,26 @@ def extract_file_from_dmg(path: Path, file_name: str) -> (Path, bool):
         subprocess.check_call(["hdiutil", "detach", unpack_dest])
 
 
+@traced("extract.pkg")
 def extract_file_from_pkg(path: Path, file_name: str) -> Path:
-    temp_dir = Path(gettempdir()) / basename(path)
-    temp_dir.mkdir(exist_ok=True)
-    logging.info(f"Unpacking {path} to {temp_dir}")
+    with TemporaryDirectory(prefix=f"mercado-{file_name}-") as temp_dir:
+        logging.info(f"Unpacking {path} to {temp_dir}")
 
-    # Unpack pkg file
-    subprocess.check_call(f"tar -xf {path} -C {temp_dir}", shell=True)
-    payload_file = glob(f"{temp_dir}/**/{PKG_PAYLOAD_FILE}", recursive=True)
-    assert len(payload_file) == 1, f"There should be one {PKG_PAYLOAD_FILE} file extracted from the pkg file {path}"
+        # Unpack pkg file
+        subprocess.check_call(f"tar -xf {path} -C {temp_dir}", shell=True)
+        payload_file = glob(f"{temp_dir}/**/{PKG_PAYLOAD_FILE}", recursive=True)
+        assert len(payload_file) == 1, f"There should be one {PKG_PAYLOAD_FILE} file extracted from the pkg file {path}"
 
-    # Unpack Payload file
-    unpack_dest = PACKAGES_DIR / file_name
-    unpack_dest.mkdir(exist_ok=True, parents=True)
-    logging.info(f"Unpacking {payload_file[0]} to {unpack_dest}")
+        # Unpack Payload file
+        unpack_dest = PACKAGES_DIR / file_name
+        unpack_dest.mkdir(exist_ok=True, parents=True)
+        logging.info(f"Unpacking {payload_file[0]} to {unpack_dest}")
 
-    subprocess.check_call(f"tar -xf {payload_file[0]} -C {unpack_dest}", shell=True)
+        subprocess.check_call(f"tar -xf {payload_file[0]} -C {unpack_dest}", shell=True)
 
+    # Directories and data files may share the name of the binary, they are told apart without running anything
     matches = glob(f"{unpack_dest}/**/{file_name}", recursive=True)
-    binaries = []
-    for match in matches:
-        with suppress(FileNotFoundError, ValueError, RuntimeError):
-            _ = get_tool_version(Path(match), silent=True)
-            binaries.append(match)
+    binaries = [match for match in matches if Path(match).is_file() and access(match, X_OK)]
 
     # TODO: Find a workaround for the fact that the pkg file contains multiple binaries
     # assert len(binaries) == 1, f"There should be one binary in the archive with the name {file_name}"
@@ -265,64 +324,147 @@ def create_session():
             HTTPStatus.GATEWAY_TIMEOUT.value,
         ],
     )
-    adapter = HTTPAdapter(max_retries=retries)
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     session.request = partial(session.request, timeout=REQUEST_MAX_TIMEOUT)
+    session.hooks["response"].append(_count_transferred)
     return session
 
 
-def filter_artifacts(names: list[str]) -> list[str]:
-    drop_names = ("checksum", "sha", ".sig", ".pem", ".sbom", "key")
-    return list(filter(lambda name: all([substr not in name for substr in drop_names]), names))
+_session: Session | None = None
+_session_lock = Lock()
+# Bytes received by host, as keyed by the connection pools
+_transferred: dict[str, int] = defaultdict(int)
 
 
-def choose_url(urls: list[str]) -> str:
-    urls = filter_artifacts(urls)
+def _count_transferred(res: Response, stream: bool = False, **kwargs):
+    # The body of a streamed response isn't read yet, its announced length is counted instead
+    size = res.headers.get("Content-Length")
+    if size is None and not stream:
+        size = len(res.content)
 
-    if len(urls) == 1:
-        return urls[0]
+    url = parse_url(res.url)
+    port = url.port or (443 if url.scheme == "https" else 80)
+    with _session_lock:
+        _transferred[f"{url.scheme}://{url.host}:{port}"] += int(size or 0)
 
-    # Priority #1 - without suffix
-    if url := _search_url(urls, no_suffix):
-        return url
 
-    # Priority #2 - an archive if available
-    if url := _search_url(urls, is_archive):
-        return url
+def get_session() -> Session:
+    """
+    The process-wide session shared by all vendors and threads.
+    Its connections are pooled per host and kept alive, so only the first request to a host pays for a handshake.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
 
-    # search url if dmg file
-    if url := _search_url(urls, is_dmg):
-        return url
 
-    raise ValueError(f"Could not find a valid URL inside {urls}. Please file a bug")
+def get_session_stats() -> dict[str, tuple[int, int, int]]:
+    """Number of requests, opened connections and received bytes for every host the shared session talked to"""
+    if _session is None:
+        return {}
 
+    stats = {}
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            stats[host] = (pool.num_requests, pool.num_connections, _transferred.get(host, 0))
+    return stats
 
-def no_suffix(item: str) -> bool:
-    return not Path(item).suffix
 
+def log_session_stats():
+    for host, (requests, connections, transferred) in get_session_stats().items():
+        logging.debug(f"{host}: {requests} requests over {connections} connections ({naturalsize(transferred)})")
 
-def _search_url(urls: list[str], func: Callable[[str], bool]) -> str:
-    ls = []
 
-    for url in urls:
-        if func(url):
-            ls.append(url)
-    if len(ls) > 1:
-        raise ValueError(f"There are several valid urls: {ls} for matcher {func.__name__}, Please file a bug")
-    if len(ls) == 1:
-        return ls[0]
-
-    return ""
+def link_or_copy(src: Path, dest: Path):
+    """Hard link src to dest when they share a filesystem, copy it otherwise"""
+    try:
+        link(src, dest)
+    except OSError:
+        clone_file(src, dest)
+
+
+def clone_file(src: Path, dest: Path):
+    """
+    Copy src to dest without moving the data through user space.
+    On Linux the file is cloned (reflink) on filesystems that share extents between files (Btrfs, XFS),
+    otherwise the kernel copies it with copy_file_range, or sendfile/fcopyfile through shutil.
+    """
+    with src.open("rb") as source, dest.open("wb") as target:
+        if FICLONE is not None:
+            with suppress(OSError):
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                return
+
+        if copy_file_range:
+            size = fstat(source.fileno()).st_size
+            try:
+                copied = 0
+                while copied < size and (count := copy_file_range(source.fileno(), target.fileno(), size - copied)):
+                    copied += count
+                if copied == size:
+                    return
+            except OSError as ex:
+                logging.debug(f"Could not copy {src} with copy_file_range: {ex}")
+
+    copyfile(src, dest)
+
+
+@traced("install.copy")
+def install_file(src: Path, dest: Path):
+    """
+    Replace dest with an executable src in a single rename, so processes that are running dest
+    or start it meanwhile see either the previous or the new binary and never a partially written one.
+    src is moved when it is on the filesystem of dest and isn't linked elsewhere (e.g. to the artifact cache),
+    otherwise it is cloned next to dest first.
+    """
+    temp_file = dest.parent / f".{dest.name}.{getpid()}.{get_ident()}"
+    try:
+        try:
+            if src.stat().st_nlink > 1:
+                raise OSError(f"{src} has other links")
+            rename(src, temp_file)
+        except OSError:
+            clone_file(src, temp_file)
+
+        temp_file.chmod(temp_file.stat().st_mode | stat.S_IEXEC)
+        replace(temp_file, dest)
+    finally:
+        temp_file.unlink(missing_ok=True)
+        path_index.invalidate(dest.parent)
 
 
-@cache
-def fetch_url(url: str, raise_for_status: bool = True) -> str:
-    logging.debug(f"Fetching {url}")
-    res = create_session().get(url)
-    if raise_for_status:
-        res.raise_for_status()
-    return res.text
+@traced("install.link")
+def install_symlink(src: Path, dest: Path):
+    """Point dest at src, replacing whatever dest was in a single rename"""
+    temp_link = dest.parent / f".{dest.name}.{getpid()}.{get_ident()}"
+    try:
+        temp_link.symlink_to(src)
+        replace(temp_link, dest)
+    finally:
+        temp_link.unlink(missing_ok=True)
+        path_index.invalidate(dest.parent)
+
+
+def parse_checksum(text: str, file_name: str) -> str:
+    """
+    The sha256 digest of file_name in a checksums file, either in the `sha256sum` format
+    (`<digest>  <file name>`, the name may be prefixed with `*` or `./`) or a file holding a single digest.
+    """
+    lines = [line.split() for line in text.splitlines() if line.strip()]
+    if len(lines) == 1 and len(lines[0]) == 1 and SHA256_PATTERN.fullmatch(lines[0][0]):
+        return lines[0][0].lower()
+
+    for line in lines:
+        if len(line) >= 2 and SHA256_PATTERN.fullmatch(line[0]) and basename(line[-1].lstrip("*")) == file_name:
+            return line[0].lower()
+    raise ValueError(f"Could not find the checksum of {file_name}")
 
 
 def get_host_operating_system() -> str:
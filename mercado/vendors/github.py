@@ -1,17 +1,135 @@
 import logging
-import re
+import math
+import time
 from dataclasses import dataclass
 from functools import cache
 from http import HTTPStatus
 from os import environ
+from os.path import basename
+from threading import Lock
 from typing import Callable, Optional
 
-from requests import Session
+from humanize import naturaldelta
+from requests import RequestException, Response
 
-from ..utils import choose_url, create_session, get_architecture_variations, is_valid_architecture, is_valid_os
+from ..assets import AssetIndex, classify_asset
+from ..cache import fetch_url, http_cache
+from ..tracing import traced
+from ..utils import get_architecture_variations, get_session, parse_checksum
 from .url_fetcher import URLDownloader
 from .vendor import Installer, Tool, ToolVendor
 
+LATEST_RELEASE_CACHE_TTL = 10 * 60
+RELEASE_CACHE_TTL = 24 * 60 * 60
+GRAPHQL_URL = "https://api.github.com/graphql"
+RELEASES_PAGE_SIZE = 100
+# Repositories queried by a single GraphQL request, larger queries risk GitHub's node and complexity limits
+GRAPHQL_BATCH_SIZE = 50
+CHECKSUM_SUFFIXES = (".sha256", ".sha256sum")
+SIGNATURE_SUFFIXES = (".sig", ".pem", ".asc", ".bundle")
+# Requests wait for an exhausted rate limit to reset when it does within this many seconds, and fail otherwise
+RATE_LIMIT_MAX_WAIT = float(environ.get("MERCADO_GITHUB_RATE_LIMIT_MAX_WAIT", 60))
+# Once fewer requests are left, cached responses are used however old they are
+RATE_LIMIT_RESERVE = int(environ.get("MERCADO_GITHUB_RATE_LIMIT_RESERVE", 10))
+
+# Latest release tags by repository, shared by every GitHub instance of the process
+_latest_versions: dict[str, str] = {}
+_latest_versions_lock = Lock()
+
+
+@dataclass
+class RateLimitBudget:
+    limit: int
+    remaining: int
+    reset: float
+
+
+class RateLimiter:
+    """
+    Schedules the requests to the GitHub API within the rate limit budget reported by the headers of its responses.
+    Budgets are tracked by resource (REST calls are 'core', GraphQL calls 'graphql'),
+    a request reserves its share of the budget up front so concurrent requests don't overdraw it.
+    """
+
+    def __init__(self):
+        self._budgets: dict[str, RateLimitBudget] = {}
+        self._lock = Lock()
+
+    def _get_budget(self, resource: str) -> RateLimitBudget | None:
+        """The known budget of the resource, a budget that already reset is unknown until the next response"""
+        budget = self._budgets.get(resource)
+        return budget if budget and budget.reset > time.time() else None
+
+    def is_low(self, resource: str) -> bool:
+        with self._lock:
+            budget = self._get_budget(resource)
+            return bool(budget) and budget.remaining < RATE_LIMIT_RESERVE
+
+    def cache_ttl(self, resource: str, ttl: float) -> float:
+        """Responses of any age are served from the cache while the budget is low"""
+        return math.inf if self.is_low(resource) else ttl
+
+    def acquire(self, resource: str) -> bool:
+        """
+        Reserve a request from the budget, waiting for an exhausted budget to reset.
+        Returns whether a request was reserved, which is not the case while the budget is unknown.
+        """
+        with self._lock:
+            if not (budget := self._get_budget(resource)):
+                return False
+            if budget.remaining > 0:
+                budget.remaining -= 1
+                return True
+            wait = budget.reset - time.time()
+
+        if wait > RATE_LIMIT_MAX_WAIT:
+            reset = time.strftime("%H:%M:%S", time.localtime(budget.reset))
+            raise ValueError(
+                f"The GitHub API rate limit is exhausted until {reset}, set GITHUB_TOKEN to get a higher rate limit"
+            )
+        logging.warning(f"The GitHub API rate limit is exhausted, waiting {wait:.0f} seconds for it to reset")
+        time.sleep(wait)
+        return False
+
+    def update(self, resource: str, res: Response, reserved: bool) -> bool:
+        """
+        Record the budget reported by the response, returns whether the request was rejected by the rate limit.
+        Responses that were served from the cache carry no budget, the request they reserved is given back.
+        """
+        headers = res.headers
+        rejected = res.status_code in (HTTPStatus.FORBIDDEN.value, HTTPStatus.TOO_MANY_REQUESTS.value) and (
+            headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in headers
+        )
+
+        with self._lock:
+            if "X-RateLimit-Remaining" in headers:
+                resource = headers.get("X-RateLimit-Resource", resource)
+                self._budgets[resource] = RateLimitBudget(
+                    int(headers["X-RateLimit-Limit"]),
+                    int(headers["X-RateLimit-Remaining"]),
+                    float(headers["X-RateLimit-Reset"]),
+                )
+            elif reserved and (budget := self._budgets.get(resource)):
+                budget.remaining += 1
+
+            # Secondary rate limits (too many concurrent requests) only tell how long to back off
+            if rejected and "Retry-After" in headers:
+                budget = self._budgets.setdefault(resource, RateLimitBudget(0, 0, 0))
+                budget.remaining, budget.reset = 0, time.time() + float(headers["Retry-After"])
+        return rejected
+
+    def report(self) -> list[str]:
+        with self._lock:
+            return [
+                f"GitHub {resource} API: {budget.remaining}/{budget.limit} requests left, "
+                f"resets in {naturaldelta(budget.reset - time.time())}"
+                for resource, budget in sorted(self._budgets.items())
+            ]
+
+
+# The rate limit applies to the token (or the IP address), so it is shared by every GitHub instance of the process
+rate_limiter = RateLimiter()
+
 
 @dataclass(frozen=True)
 class GitHubTool(Tool):
@@ -20,6 +138,8 @@ class GitHubTool(Tool):
 
 
 class GitHub(ToolVendor):
+    supports_versions = True
+
     def __init__(self):
         self._token = self._get_local_token()
 
@@ -27,21 +147,37 @@ class GitHub(ToolVendor):
         # TODO: Make more sophisticated
         return environ.get("GITHUB_TOKEN")
 
-    def _session(self) -> Session:
-        s = create_session()
+    def _headers(self) -> dict[str, str]:
+        # The session is shared with other vendors, so the token is sent per request
         if self._token:
-            s.headers = {"Authorization": "Bearer " + self._token}
-        return s
+            return {"Authorization": "Bearer " + self._token}
+        return {}
+
+    def _request(self, resource: str, send: Callable[[], Response]) -> Response:
+        """Send an API request within the rate limit, a request that was rejected by it is sent again once"""
+        for _ in range(2):
+            reserved = rate_limiter.acquire(resource)
+            res = send()
+            if not rate_limiter.update(resource, res, reserved):
+                break
+        return res
 
+    def _get(self, url: str, ttl: float) -> Response:
+        return self._request(
+            "core", lambda: http_cache.get(url, rate_limiter.cache_ttl("core", ttl), headers=self._headers())
+        )
+
+    @traced("github.latest_release")
     def _get_latest_release(self, tool: GitHubTool):
-        res = self._session().get(f"https://api.github.com/repos/{tool.repository}/releases/latest")
+        res = self._get(f"https://api.github.com/repos/{tool.repository}/releases/latest", LATEST_RELEASE_CACHE_TTL)
         if res.status_code == HTTPStatus.NOT_FOUND.value:
             raise ValueError(f"tool {tool.repository} was not found")
         res.raise_for_status()
         return res.json()
 
+    @traced("github.release")
     def _get_release_by_tag(self, tool: GitHubTool, tag: str):
-        res = self._session().get(f"https://api.github.com/repos/{tool.repository}/releases/tags/{tag}")
+        res = self._get(f"https://api.github.com/repos/{tool.repository}/releases/tags/{tag}", RELEASE_CACHE_TTL)
         if res.status_code == HTTPStatus.NOT_FOUND.value:
             raise ValueError(f"version {tag} was not found for {tool.repository}")
 
@@ -49,34 +185,123 @@ class GitHub(ToolVendor):
         return res.json()
 
     def _get_asset_url(self, tool: GitHubTool, os: str, arch: str, assets: list[dict[str, str]]) -> str:
-        valid_assets_urls = []
-
-        logging.debug(f"Found the following assets: {list(map(lambda asset: asset['name'], assets))}")
+        index = AssetIndex([classify_asset(asset["name"], asset["browser_download_url"]) for asset in assets])
+        logging.debug(f"Found the following assets: {[asset.name for asset in index.assets]}")
 
         templates = []
         if tool.asset_template:
-            for arch in get_architecture_variations(arch):
-                templates.append(tool.asset_template(os, arch))
+            for arch_variation in get_architecture_variations(arch):
+                templates.append(tool.asset_template(os, arch_variation))
             logging.debug(f"Tool {tool.name} has the following asset templates: {templates}")
 
-        for asset in assets:
-            for template in templates:
-                if re.search(asset["name"], template, re.IGNORECASE):
-                    return asset["browser_download_url"]
+        return index.select(tool.name, os, arch, templates)
 
+    @traced("github.checksum")
+    def _get_asset_checksum(self, assets: list[dict[str, str]], url: str) -> str:
+        """
+        The sha256 digest of the asset of url, as reported by GitHub or published in a checksums asset.
+        An asset specific checksums file (`<asset>.sha256`) is preferred over one that covers the whole release.
+        """
+        name = basename(url)
+        asset = next((asset for asset in assets if asset["browser_download_url"] == url), {})
+        if (digest := asset.get("digest") or "").startswith("sha256:"):
+            return digest.removeprefix("sha256:")
+
+        checksum_assets = [f"{name}{suffix}" for suffix in CHECKSUM_SUFFIXES]
+        for asset in assets:
+            lower_name = asset["name"].lower()
             if (
-                re.search(tool.name, asset["name"], re.IGNORECASE)
-                and is_valid_os(expected=os, actual=asset["name"])
-                and is_valid_architecture(expected=arch, actual=asset["name"])
+                any(substr in lower_name for substr in ("checksum", "sha256"))
+                and not lower_name.endswith(SIGNATURE_SUFFIXES + CHECKSUM_SUFFIXES)
+                and asset["name"] not in checksum_assets
             ):
-                valid_assets_urls.append(asset["browser_download_url"])
+                checksum_assets.append(asset["name"])
 
-        logging.debug(f"Looking for the best url from: {valid_assets_urls}")
-        return choose_url(valid_assets_urls)
+        urls = {asset["name"]: asset["browser_download_url"] for asset in assets}
+        for checksum_asset in filter(urls.__contains__, checksum_assets):
+            try:
+                return parse_checksum(fetch_url(urls[checksum_asset]), name)
+            except (ValueError, RequestException) as ex:
+                logging.debug(f"Could not get the checksum of {name} from {checksum_asset}: {ex}")
+
+        logging.debug(f"There is no published checksum for {name}")
+        return ""
+
+    @traced("github.latest_releases")
+    def _get_latest_tags(self, repositories: list[str]) -> dict[str, str]:
+        """Query the latest release tag of many repositories with a single GraphQL request"""
+        variables = {}
+        fields = []
+        for i, repository in enumerate(repositories):
+            variables[f"owner{i}"], variables[f"name{i}"] = repository.split("/", 1)
+            fields.append(f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{ latestRelease {{ tagName }} }}")
+
+        arguments = ", ".join(f"${variable}: String!" for variable in variables)
+        query = f"query({arguments}) {{ {' '.join(fields)} }}"
+
+        logging.debug(f"Querying the latest releases of {repositories}")
+        res = self._request(
+            "graphql",
+            lambda: get_session().post(
+                GRAPHQL_URL, json={"query": query, "variables": variables}, headers=self._headers()
+            ),
+        )
+        res.raise_for_status()
+
+        # Missing repositories are reported as errors alongside the data of the valid ones
+        data = res.json().get("data") or {}
+        tags = {}
+        for i, repository in enumerate(repositories):
+            if release := (data.get(f"r{i}") or {}).get("latestRelease"):
+                tags[repository] = release["tagName"]
+        return tags
 
-    @cache
     def get_latest_version(self, tool: GitHubTool):
-        return self._get_latest_release(tool)["tag_name"]
+        with _latest_versions_lock:
+            if tool.repository in _latest_versions:
+                return _latest_versions[tool.repository]
+
+        version = self._get_latest_release(tool)["tag_name"]
+        with _latest_versions_lock:
+            _latest_versions[tool.repository] = version
+        return version
+
+    @traced("github.releases")
+    def get_versions_page(self, tool: GitHubTool, cursor: str = "") -> tuple[list[str], str]:
+        # The cursor is the page number, a page that shifted since it was fetched only repeats known releases
+        page = int(cursor or 1)
+        res = self._get(
+            f"https://api.github.com/repos/{tool.repository}/releases?per_page={RELEASES_PAGE_SIZE}&page={page}",
+            LATEST_RELEASE_CACHE_TTL,
+        )
+        if res.status_code == HTTPStatus.NOT_FOUND.value:
+            raise ValueError(f"tool {tool.repository} was not found")
+        res.raise_for_status()
+
+        releases = res.json()
+        tags = [release["tag_name"] for release in releases if not release.get("draft")]
+        return tags, str(page + 1) if len(releases) == RELEASES_PAGE_SIZE else ""
+
+    def prefetch_latest_versions(self, tools: list[GitHubTool]):
+        # GraphQL is only available to authenticated requests, anonymous lookups are left to get_latest_version
+        if not self._token:
+            return
+
+        with _latest_versions_lock:
+            missing = sorted({tool.repository for tool in tools} - _latest_versions.keys())
+        if len(missing) < 2:
+            return
+
+        for start in range(0, len(missing), GRAPHQL_BATCH_SIZE):
+            batch = missing[start : start + GRAPHQL_BATCH_SIZE]
+            try:
+                tags = self._get_latest_tags(batch)
+            except (RequestException, ValueError) as ex:
+                # The repositories of a failed batch are left to their own REST lookups
+                logging.warning(f"Failed to query the latest releases of {len(batch)} repositories ({ex})")
+                continue
+            with _latest_versions_lock:
+                _latest_versions.update(tags)
 
     @cache
     def get_installer(self, tool: GitHubTool, version: str, os: str, arch: str) -> Installer:
@@ -87,4 +312,5 @@ class GitHub(ToolVendor):
             raise ValueError(f"There is no available asset {tool.name} for {os=}, {arch=}, {version=}")
 
         logging.debug(f"Found {tool.name} with version {version} on URL {url}")
-        return URLDownloader(tool.name, version, url, tool.target)
+        checksum = self._get_asset_checksum(res["assets"], url)
+        return URLDownloader(tool.name, version, url, tool.target, checksum)
@@ -1,39 +1,87 @@
 import logging
-from functools import cache
+from collections import defaultdict
+from functools import cache, cached_property
 from http import HTTPStatus
+from os.path import basename
 
-from ..utils import choose_url, create_session, is_valid_architecture, is_valid_os
+from requests import RequestException
+
+from ..assets import choose_url
+from ..cache import disk_cache, fetch_url, http_cache
+from ..tracing import traced
+from ..utils import get_session, is_valid_architecture, is_valid_os, parse_checksum
 from .url_fetcher import URLDownloader
 from .vendor import Installer, Tool, ToolVendor
 
+PRODUCTS_CACHE_TTL = 24 * 60 * 60
+LATEST_RELEASES_CACHE_TTL = 10 * 60
+RELEASE_CACHE_TTL = 24 * 60 * 60
+RELEASES_URL = "https://api.releases.hashicorp.com/v1/releases"
+# The maximal page size of the releases API
+RELEASES_PAGE_SIZE = 20
+
 
 class Hashicorp(ToolVendor):
+    supports_versions = True
+
     def __init__(self):
-        self._products = self._get_hashicorp_products()
+        # Releases that were already fetched, by product name and version
+        self._releases: dict[str, dict[str, dict]] = defaultdict(dict)
 
-    def _get_hashicorp_products(self):
-        res = create_session().get("https://api.releases.hashicorp.com/v1/products")
+    @cached_property
+    def _products(self) -> list[str]:
+        return disk_cache.get_or_set("hashicorp-products", PRODUCTS_CACHE_TTL, self._get_hashicorp_products)
+
+    @traced("hashicorp.products")
+    def _get_hashicorp_products(self) -> list[str]:
+        res = get_session().get("https://api.releases.hashicorp.com/v1/products")
         res.raise_for_status()
         return res.json()
 
-    def _get_hashicorp_product_releases(self, name: str, version: str = ""):
+    @traced("hashicorp.releases")
+    def _get_hashicorp_product_releases(self, name: str, limit: int = 1, after: str = "") -> list[dict]:
+        """
+        A single page of the product releases, ordered by creation time from newest to oldest.
+        Older pages are requested by passing the creation time of the last release of the previous page.
+        """
         if name not in self._products:
             raise ValueError(name)
 
-        if version:
-            res = create_session().get(
-                f"https://api.releases.hashicorp.com/v1/releases/{name}/{version}?license_class=oss",
-            )
-            if res.status_code == HTTPStatus.NOT_FOUND.value:
-                raise ValueError(f"version {version} was not found for {name}")
-        else:
-            res = create_session().get(f"https://api.releases.hashicorp.com/v1/releases/{name}?license_class=oss")
+        url = f"{RELEASES_URL}/{name}?license_class=oss&limit={limit}"
+        if after:
+            url += f"&after={after}"
+
+        res = http_cache.get(url, LATEST_RELEASES_CACHE_TTL if not after else RELEASE_CACHE_TTL)
         res.raise_for_status()
-        return res.json()
+        releases = res.json()
+        self._index_releases(name, releases)
+        return releases
+
+    @traced("hashicorp.release")
+    def _get_hashicorp_product_release(self, name: str, version: str) -> dict:
+        if release := self._releases[name].get(version):
+            logging.debug(f"Using the indexed release {version} of {name}")
+            return release
+
+        if name not in self._products:
+            raise ValueError(name)
+
+        res = http_cache.get(f"{RELEASES_URL}/{name}/{version}?license_class=oss", RELEASE_CACHE_TTL)
+        if res.status_code == HTTPStatus.NOT_FOUND.value:
+            raise ValueError(f"version {version} was not found for {name}")
+        res.raise_for_status()
+
+        release = res.json()
+        self._index_releases(name, [release])
+        return release
+
+    def _index_releases(self, name: str, releases: list[dict]):
+        for release in releases:
+            self._releases[name][release["version"]] = release
 
     def _get_hashicorp_latest_release(self, name: str):
-        # Results are ordered by release creation time from newest to oldest
-        data = self._get_hashicorp_product_releases(name)
+        # Only the newest release is requested, it already contains the builds needed by the installer
+        data = self._get_hashicorp_product_releases(name, limit=1)
         return data[0]
 
     def _get_build_url(self, os: str, arch: str, builds: list[dict[str, str]]) -> str:
@@ -51,16 +99,33 @@ class Hashicorp(ToolVendor):
         logging.debug(f"Looking for the best url from: {valid_assets_urls}")
         return choose_url(valid_assets_urls)
 
+    @traced("hashicorp.checksum")
+    def _get_build_checksum(self, release: dict, url: str) -> str:
+        if not (shasums_url := release.get("url_shasums")):
+            logging.debug(f"There is no published checksum for {url}")
+            return ""
+
+        try:
+            return parse_checksum(fetch_url(shasums_url), basename(url))
+        except (ValueError, RequestException) as ex:
+            logging.debug(f"Could not get the checksum of {url} from {shasums_url}: {ex}")
+            return ""
+
     @cache
     def get_latest_version(self, tool: Tool) -> str:
         return self._get_hashicorp_latest_release(tool.name)["version"]
 
+    def get_versions_page(self, tool: Tool, cursor: str = "") -> tuple[list[str], str]:
+        releases = self._get_hashicorp_product_releases(tool.name, limit=RELEASES_PAGE_SIZE, after=cursor)
+        cursor = releases[-1]["timestamp_created"] if len(releases) == RELEASES_PAGE_SIZE else ""
+        return [release["version"] for release in releases], cursor
+
     @cache
     def get_installer(self, tool: Tool, version: str, os: str, arch: str) -> Installer:
-        res = self._get_hashicorp_product_releases(tool.name, version)
+        res = self._get_hashicorp_product_release(tool.name, version)
         url = self._get_build_url(os, arch, res["builds"])
         if not url:
             raise ValueError(f"There is no available build {tool.name} for {os=}, {arch=}, {version=}")
 
         logging.debug(f"Found {tool.name} with version {version} on URL {url}")
-        return URLDownloader(tool.name, version, url, tool.target)
+        return URLDownloader(tool.name, version, url, tool.target, self._get_build_checksum(res, url))
@@ -6,19 +6,30 @@ from tempfile import TemporaryDirectory
 from textwrap import dedent
 from typing import Callable
 
-from ..utils import INSTALL_DIR
+from rich.progress import Progress
+
+from ..tracing import traced
+from ..utils import INSTALL_DIR, path_index
+from .github import GitHub, GitHubTool
 from .vendor import Installer, Tool, ToolVendor
 
 
 @dataclass(frozen=True)
 class ShellTool(Tool):
     get_latest_version: Callable[[], str] = None
+    # The GitHub repository that versions the tool, used instead of get_latest_version when set
+    release: GitHubTool = None
     download_script: Callable[[str, str, str], str] = None
     env_vars: dict[str, str] = field(default_factory=dict)
 
 
 class Shell(ToolVendor):
+    # Scripts download and install by themselves
+    supports_cache = False
+
     def get_latest_version(self, tool: ShellTool) -> str:
+        if tool.release:
+            return GitHub().get_latest_version(tool.release)
         return tool.get_latest_version()
 
     def get_installer(self, tool: ShellTool, version: str, os: str, arch: str) -> Installer:
@@ -42,7 +53,8 @@ class ShellRunner(Installer):
         self._install_script = install_script
         self._env = env
 
-    def install(self):
+    @traced("shell.script")
+    def install(self, progress: Progress | None = None):
         script = "set -o errexit"
         script += dedent(self._install_script(self.version, self.os, self.arch))
         with TemporaryDirectory() as tmp_dir:
@@ -53,3 +65,5 @@ class ShellRunner(Installer):
                 shell=True,
                 cwd=tmp_dir,
             )
+        # Scripts install anywhere, usually into INSTALL_DIR
+        path_index.invalidate(INSTALL_DIR)
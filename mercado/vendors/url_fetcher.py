@@ -1,27 +1,52 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from http import HTTPStatus
 from pathlib import Path
 from typing import Callable
 
+from requests import RequestException
+from rich.progress import Progress
+
+from ..cache import disk_cache, fetch_url
+from ..download import cache_artifact, download_url
+from ..tracing import span
 from ..utils import (
-    create_session,
+    MAX_WORKERS,
     default_install_path,
-    download_url,
-    fetch_url,
     get_architecture_variations,
     get_operating_system_variations,
+    get_session,
 )
 from .vendor import Installer, Tool, ToolVendor
 
+VARIATION_CACHE_TTL = 30 * 24 * 60 * 60
+
 
 @dataclass(frozen=True)
 class URLFetcherTool(Tool):
     get_latest_version_url: str = ""
     get_release_by_version_url: Callable[[str, str, str], str] = None
+    # The GitHub repository that versions the tool, used to list its releases
+    release: Tool = None
 
 
 class URLFetcher(ToolVendor):
+    def _is_url_available(self, url: str) -> bool:
+        with span("url_fetcher.head", url=url):
+            res = get_session().head(url)
+        if res.status_code == HTTPStatus.NOT_FOUND.value:
+            logging.debug(f"URL {url} was not found")
+        return res.status_code == HTTPStatus.OK.value
+
+    def _probe_url(self, url: str) -> bool:
+        """Whether the url is available, a candidate that fails (e.g. a variation whose host doesn't exist) is a miss"""
+        try:
+            return self._is_url_available(url)
+        except RequestException as ex:
+            logging.debug(f"URL {url} could not be probed ({ex})")
+            return False
+
     def _check_urls(
         self,
         tool: URLFetcherTool,
@@ -30,20 +55,36 @@ class URLFetcher(ToolVendor):
         version: str,
         url_template: Callable[[str, str], str],
     ) -> str:
-        urls = []
-        for arch in get_architecture_variations(arch):
-            for os in get_operating_system_variations(os):
-                urls.append(url_template(os, arch, version))
+        variations = []
+        for arch_variation in get_architecture_variations(arch):
+            for os_variation in get_operating_system_variations(os):
+                variations.append((os_variation, arch_variation))
+
+        # The variation that was valid on a previous install is probed alone before all the others
+        cache_key = f"url-fetcher-variation:{tool.name}:{os}:{arch}"
+        if remembered := disk_cache.get(cache_key, VARIATION_CACHE_TTL):
+            remembered = tuple(remembered)
+            if remembered in variations:
+                url = url_template(*remembered, version)
+                if self._probe_url(url):
+                    return url
+                variations.remove(remembered)
 
-        logging.debug(f"Tool {tool.name} has the following urls: {urls}")
+        urls = {url_template(*variation, version): variation for variation in variations}
+        logging.debug(f"Tool {tool.name} has the following urls: {list(urls)}")
 
-        for url in urls:
-            res = create_session().head(url)
-            if res.status_code == HTTPStatus.NOT_FOUND.value:
-                logging.debug(f"URL {url} was not found")
-                continue
-            if res.status_code == HTTPStatus.OK.value:
-                return url
+        # The first valid response wins, probes that did not start yet are cancelled and the ones in flight are
+        # waited for, so none of them outlives the lookup
+        executor = ThreadPoolExecutor(max_workers=max(min(len(urls), MAX_WORKERS), 1))
+        try:
+            futures = {executor.submit(self._probe_url, url): url for url in urls}
+            for future in as_completed(futures):
+                if future.result():
+                    url = futures[future]
+                    disk_cache.set(cache_key, urls[url])
+                    return url
+        finally:
+            executor.shutdown(cancel_futures=True)
 
         raise ValueError(f"{tool.name} URL is not valid")
 
@@ -56,11 +97,15 @@ class URLFetcher(ToolVendor):
 
 
 class URLDownloader(Installer):
-    def __init__(self, name: str, version: str, url: str, target: Path):
+    def __init__(self, name: str, version: str, url: str, target: Path, checksum: str = ""):
         self.name = name
         self.version = version
         self._url = url
+        self._checksum = checksum
         self.target = target if target else default_install_path(self.name)
 
-    def install(self):
-        download_url(self.name, self._url, self.target)
+    def install(self, progress: Progress | None = None):
+        download_url(self.name, self._url, self.target, progress, self._checksum)
+
+    def cache(self, progress: Progress | None = None):
+        cache_artifact(self.name, self._url, progress, self._checksum)
@@ -2,6 +2,8 @@ from dataclasses import dataclass, field
 from enum import StrEnum, auto
 from pathlib import Path
 
+from rich.progress import Progress
+
 
 class Label(StrEnum):
     DOCS = auto()
@@ -25,6 +27,10 @@ class Tool:
     name: str
     labels: tuple[Label, ...] = field(default_factory=tuple)
     target: Path = None
+    # Other names the tool is known by, e.g. the name of its package in other package managers
+    aliases: tuple[str, ...] = field(default_factory=tuple)
+    # The arguments that print the version of the tool, they are probed (and remembered) when not declared
+    version_args: tuple[str, ...] = field(default_factory=tuple)
 
 
 @dataclass
@@ -32,13 +38,32 @@ class Installer:
     name: str
     version: str
 
-    def install(self):
+    def install(self, progress: Progress | None = None):
+        raise NotImplementedError
+
+    def cache(self, progress: Progress | None = None):
+        """Download the artifact into the artifact cache without installing it"""
         raise NotImplementedError
 
 
 class ToolVendor:
+    # Whether the artifacts of the tools are downloaded, and so can be kept in the artifact cache without installing
+    supports_cache: bool = True
+    # Whether get_versions_page lists the releases of the tools, version constraints are resolved over them
+    supports_versions: bool = False
+
     def get_latest_version(self, tool: Tool) -> str:
         raise NotImplementedError
 
+    def prefetch_latest_versions(self, tools: list[Tool]):
+        """Resolve the latest versions of many tools at once when the vendor can, get_latest_version serves them"""
+
+    def get_versions_page(self, tool: Tool, cursor: str = "") -> tuple[list[str], str]:
+        """
+        A page of the released versions of the tool from newest to oldest, starting at the cursor ("" for the newest),
+        and the cursor of the following page, which is empty after the last one
+        """
+        raise NotImplementedError
+
     def get_installer(self, tool: Tool, version: str, os: str, arch: str) -> Installer:
         raise NotImplementedError
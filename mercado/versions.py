@@ -0,0 +1,234 @@
+import logging
+import math
+import re
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from functools import cache, total_ordering
+from itertools import takewhile
+from typing import Callable
+
+from .cache import disk_cache
+
+# Release indexes are refreshed with the newest page of releases when they are older than this
+RELEASE_INDEX_TTL = 10 * 60
+
+VERSION_PATTERN = re.compile(
+    r"v?(?P<release>\d+(?:\.\d+)*)(?:-?(?P<prerelease>[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?(?:\+(?P<build>[0-9A-Za-z.-]+))?"
+)
+
+
+@total_ordering
+@dataclass(frozen=True)
+class Version:
+    """A semantic version, ordered by semver precedence (the build metadata is ignored)"""
+
+    release: tuple[int, ...]
+    prerelease: tuple[int | str, ...] = ()
+
+    @property
+    def is_prerelease(self) -> bool:
+        return bool(self.prerelease)
+
+    def _key(self) -> tuple:
+        # Missing components are zeros (1.2 == 1.2.0) and a release comes after its pre-releases
+        release = self.release + (0,) * (3 - len(self.release))
+        # Numeric identifiers have a lower precedence than alphanumeric ones
+        prerelease = tuple((0, item, "") if isinstance(item, int) else (1, 0, item) for item in self.prerelease)
+        return release, not self.prerelease, prerelease
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Version) and self._key() == other._key()
+
+    def __lt__(self, other: "Version") -> bool:
+        return self._key() < other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __str__(self) -> str:
+        version = ".".join(map(str, self.release))
+        if self.prerelease:
+            version += "-" + ".".join(map(str, self.prerelease))
+        return version
+
+
+@cache
+def parse_version(text: str) -> Version:
+    """Parse versions the way tools report them, e.g. 'v1.2.3', '1.2.3-rc.1', '0.20.0+abc' or 'v1.29'"""
+    match = VERSION_PATTERN.fullmatch(text.strip())
+    if not match:
+        raise ValueError(f"'{text}' is not a valid version")
+
+    prerelease = ()
+    if match["prerelease"]:
+        prerelease = tuple(int(item) if item.isdigit() else item for item in match["prerelease"].split("."))
+    return Version(tuple(map(int, match["release"].split("."))), prerelease)
+
+
+def is_outdated(local_version: str, latest_version: str) -> bool:
+    """Whether a newer version than the local one was released, versions that can't be parsed must be equal"""
+    try:
+        return parse_version(local_version) < parse_version(latest_version)
+    except ValueError:
+        return local_version.lstrip("v") != latest_version.lstrip("v")
+
+
+CONSTRAINT_OPERATORS = ("~>", "==", "!=", ">=", "<=", ">", "<", "~", "^", "=")
+CLAUSE_PATTERN = re.compile(r"\s*(?P<operator>~>|==|!=|>=|<=|>|<|~|\^|=)?\s*(?P<version>[^\s,]+)\s*")
+
+
+@dataclass(frozen=True)
+class VersionConstraint:
+    """
+    A comma separated list of clauses that a version must all satisfy, e.g. '>=0.20,<0.22'.
+    Besides the comparison operators, '~1.5' allows patches (>=1.5,<1.6), '^1.5' allows minor releases (>=1.5,<2)
+    and '~>1.5' is the Terraform pessimistic operator (>=1.5,<2, or >=1.5.2,<1.6 for '~>1.5.2').
+    Pre-releases are only allowed when one of the clauses mentions a pre-release.
+    """
+
+    clauses: tuple[tuple[str, Version], ...]
+
+    @property
+    def allows_prereleases(self) -> bool:
+        return any(version.is_prerelease for _, version in self.clauses)
+
+    @property
+    def lower_bound(self) -> Version | None:
+        bounds = [version for operator, version in self.clauses if operator in (">=", ">", "==")]
+        return max(bounds) if bounds else None
+
+    def allows(self, version: Version) -> bool:
+        if version.is_prerelease and not self.allows_prereleases:
+            return False
+        return all(_compare(operator, version, bound) for operator, bound in self.clauses)
+
+    def __str__(self) -> str:
+        return ",".join(f"{operator}{version}" for operator, version in self.clauses)
+
+    def best(self, tags: list[str]) -> str:
+        """The tag of the highest allowed version, tags that aren't versions are ignored"""
+        allowed = []
+        for tag in tags:
+            with suppress(ValueError):
+                if self.allows(version := parse_version(tag)):
+                    allowed.append((version, tag))
+        return max(allowed)[1] if allowed else ""
+
+
+def _compare(operator: str, version: Version, bound: Version) -> bool:
+    match operator:
+        case "==":
+            return version == bound
+        case "!=":
+            return version != bound
+        case ">=":
+            return version >= bound
+        case "<=":
+            return version <= bound
+        case ">":
+            return version > bound
+        case "<":
+            return version < bound
+    raise ValueError(f"Unknown operator {operator}")
+
+
+def _bump(version: Version, index: int) -> Version:
+    """The lowest version that doesn't share the first index + 1 release components of version"""
+    return Version(version.release[:index] + (version.release[index] + 1,))
+
+
+def is_version_constraint(spec: str) -> bool:
+    """Whether the version part of `name@version` is a constraint and not a tag"""
+    return spec.startswith(CONSTRAINT_OPERATORS) or "," in spec
+
+
+@cache
+def parse_version_constraint(spec: str) -> VersionConstraint:
+    clauses = []
+    for clause in spec.split(","):
+        if not (match := CLAUSE_PATTERN.fullmatch(clause)):
+            raise ValueError(f"'{clause}' is not a valid version constraint")
+
+        operator, version = match["operator"] or "==", parse_version(match["version"])
+        if operator == "=":
+            operator = "=="
+
+        if operator in ("~", "^", "~>"):
+            if operator == "~":
+                # ~1 allows minor releases like ^1, ~1.5 and ~1.5.2 only allow patches
+                index = min(len(version.release), 2) - 1
+            elif operator == "^":
+                # The left-most non-zero component is fixed
+                index = next((i for i, item in enumerate(version.release) if item), len(version.release) - 1)
+            else:
+                index = max(len(version.release) - 2, 0)
+            clauses.extend([(">=", version), ("<", _bump(version, index))])
+        else:
+            clauses.append((operator, version))
+
+    return VersionConstraint(tuple(clauses))
+
+
+class ReleaseIndex:
+    """
+    The release tags of a tool, newest first, fetched page by page from its vendor and kept in the disk cache.
+    Refreshing the index only fetches the pages that were published since the last time (usually just the first one),
+    older pages are fetched only while the known releases don't satisfy the constraint being resolved.
+    """
+
+    def __init__(self, key: str, fetch_page: Callable[[str], tuple[list[str], str]]):
+        """fetch_page returns the tags of the page at a cursor ("" for the newest) and the cursor of the next one"""
+        self._key = f"release-index:{key}"
+        self._fetch_page = fetch_page
+
+    def _load(self) -> dict:
+        index = disk_cache.get(self._key, ttl=math.inf)
+        return index or {"tags": [], "cursor": "", "complete": False, "refreshed": 0}
+
+    def _refresh(self, index: dict):
+        known = set(index["tags"])
+        new_tags = []
+        cursor = ""
+        while True:
+            tags, cursor = self._fetch_page(cursor)
+            fresh_tags = list(takewhile(lambda tag: tag not in known, tags))
+            new_tags.extend(fresh_tags)
+            # Pages are fetched until one of them reaches the known tags, a new index starts with a single page
+            if not known or not cursor or len(fresh_tags) < len(tags):
+                break
+
+        if not known:
+            index["cursor"], index["complete"] = cursor, not cursor
+        index["tags"] = new_tags + index["tags"]
+        index["refreshed"] = time.time()
+        disk_cache.set(self._key, index)
+
+    def _fetch_older(self, index: dict):
+        tags, cursor = self._fetch_page(index["cursor"])
+        known = set(index["tags"])
+        index["tags"].extend(tag for tag in tags if tag not in known)
+        index["cursor"], index["complete"] = cursor, not cursor
+        disk_cache.set(self._key, index)
+
+    def resolve(self, constraint: VersionConstraint) -> str:
+        index = self._load()
+        if time.time() - index["refreshed"] > RELEASE_INDEX_TTL:
+            self._refresh(index)
+
+        while not (tag := constraint.best(index["tags"])):
+            # Releases are listed from newest to oldest, so once they are older than the constraint nothing will match
+            if index["complete"] or _is_below(index["tags"], constraint.lower_bound):
+                raise ValueError(f"There is no release that satisfies {constraint}")
+            logging.debug(f"Fetching older releases of {self._key}")
+            self._fetch_older(index)
+        return tag
+
+
+def _is_below(tags: list[str], lower_bound: Version | None) -> bool:
+    if not lower_bound:
+        return False
+    for tag in reversed(tags):
+        with suppress(ValueError):
+            return parse_version(tag) < lower_bound
+    return False
@@ -1,32 +1,89 @@
+import shutil
+from os import environ, pathsep
+from pathlib import Path
+from tempfile import mkdtemp
+
 import pytest
 
-from mercado.tool_manager import ToolManager
-from mercado.utils import get_host_architecture, get_host_operating_system
-from mercado.vendors.github import GitHub
-from mercado.vendors.hashicorp import Hashicorp
-from mercado.vendors.vendor import ToolVendor
+# Tests run against local stand-ins of the release APIs (benchmarks/fake_server.py),
+# MERCADO_LIVE_TESTS=1 runs them against the real ones to verify the published artifacts
+LIVE = bool(environ.get("MERCADO_LIVE_TESTS"))
+home_key = pytest.StashKey[Path]()
+
+
+def pytest_configure(config: pytest.Config):
+    config.addinivalue_line("markers", "live: needs hosts the fake server can't stand in for (e.g. install scripts)")
+    if LIVE:
+        return
+
+    # mercado resolves its directories when it is imported, so they are moved before any test module imports it
+    home = Path(mkdtemp(prefix="mercado-tests-"))
+    config.stash[home_key] = home
+    environ["HOME"] = str(home)
+    environ["PATH"] = f"{home / '.mercado'}{pathsep}{environ['PATH']}"
+    for name in ("MERCADO_CACHE_DIR", "DOCKER_CONFIG"):
+        environ.pop(name, None)
+
+
+def pytest_unconfigure(config: pytest.Config):
+    if home := config.stash.get(home_key, None):
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]):
+    if LIVE:
+        return
+
+    skip = pytest.mark.skip(reason="Talks to the real hosts, set MERCADO_LIVE_TESTS=1 to run it")
+    for item in items:
+        if "live" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_server():
+    if LIVE:
+        yield None
+        return
+
+    from benchmarks.fake_server import FakeServer
+    from mercado.utils import get_session
+
+    with FakeServer() as server:
+        server.route(get_session())
+        yield server
 
 
 @pytest.fixture
 def os():
+    from mercado.utils import get_host_operating_system
+
     return get_host_operating_system()
 
 
 @pytest.fixture
 def arch():
+    from mercado.utils import get_host_architecture
+
     return get_host_architecture()
 
 
 @pytest.fixture
-def hashicorp() -> ToolVendor:
+def hashicorp():
+    from mercado.vendors.hashicorp import Hashicorp
+
     return Hashicorp()
 
 
 @pytest.fixture
-def github() -> ToolVendor:
+def github():
+    from mercado.vendors.github import GitHub
+
     return GitHub()
 
 
 @pytest.fixture
-def toolmanager() -> ToolManager:
+def toolmanager():
+    from mercado.tool_manager import ToolManager
+
     return ToolManager()
@@ -0,0 +1,59 @@
+import pytest
+
+from mercado.assets import AssetIndex, choose_url, classify_asset
+
+
+@pytest.mark.parametrize(
+    "name,tool,os,arch,format,is_checksum",
+    [
+        ("trivy_0.50.1_macOS-64bit.tar.gz", "trivy", "darwin", "amd64", "archive", False),
+        ("trivy_0.50.1_Linux-ARM64.tar.gz.sig", "trivy", "linux", "arm64", "other", True),
+        ("docker-compose-linux-aarch64", "docker-compose", "linux", "arm64", "binary", False),
+        ("sops-v3.8.1.linux.amd64", "sops", "linux", "amd64", "binary", False),
+        ("k3d-windows-amd64.exe", "k3d", "windows", "amd64", "binary", False),
+        ("minikube_1.32.0-0_arm64.deb", "minikube", "", "arm64", "package", False),
+        ("karmada-linux-armv7", "karmada", "linux", "arm", "binary", False),
+        ("checksums.txt", "checksums", "", "", "other", True),
+    ],
+)
+def test_classify_asset(name: str, tool: str, os: str, arch: str, format: str, is_checksum: bool):
+    asset = classify_asset(name)
+
+    assert (asset.tool, asset.os, asset.arch, asset.format, asset.is_checksum) == (tool, os, arch, format, is_checksum)
+
+
+@pytest.fixture
+def index() -> AssetIndex:
+    return AssetIndex.from_urls(
+        [
+            "tool_Linux_x86_64.tar.gz",
+            "tool_Linux_x86_64.tar.gz.sig",
+            "tool_linux_amd64.deb",
+            "tool-linux-amd64",
+            "tool-completions-linux-amd64",
+            "tool_Darwin_arm64.tar.gz",
+            "tool_Darwin_arm64.zip",
+            "checksums.txt",
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "os,arch,url",
+    [("linux", "x86_64", "tool-linux-amd64"), ("linux", "arm64", ""), ("macos", "aarch64", None)],
+)
+def test_select_asset(index: AssetIndex, os: str, arch: str, url: str | None):
+    if url is None:
+        with pytest.raises(ValueError):
+            index.select("tool", os, arch)
+    else:
+        assert index.select("tool", os, arch) == url
+
+
+def test_select_asset_by_template(index: AssetIndex):
+    assert index.select("tool", "linux", "amd64", ["tool-completions-linux-amd64"]) == "tool-completions-linux-amd64"
+
+
+def test_choose_url():
+    assert choose_url(["terraform_1.6.0_linux_amd64.zip"]) == "terraform_1.6.0_linux_amd64.zip"
+    assert choose_url(["tool.dmg", "tool.tar.gz", "tool.tar.gz.sha256"]) == "tool.tar.gz"
@@ -0,0 +1,99 @@
+import os
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+
+import pytest
+
+from mercado.cache import ArtifactStore, DiskCache, HTTPCache
+
+ETAG = '"v1"'
+
+
+class ReleaseHandler(BaseHTTPRequestHandler):
+    requests: list[str] = []
+
+    def do_GET(self):  # noqa: N802
+        ReleaseHandler.requests.append(self.headers.get("If-None-Match", ""))
+
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(HTTPStatus.NOT_MODIFIED.value)
+            self.end_headers()
+            return
+
+        body = f'{{"tag_name": "{self.path}"}}'.encode()
+        self.send_response(HTTPStatus.OK.value)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    ReleaseHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReleaseHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_disk_cache_ttl(tmp_path: Path):
+    cache = DiskCache(tmp_path)
+    cache.set("products", ["terraform"])
+
+    assert cache.get("products", ttl=60) == ["terraform"]
+    assert cache.get("products", ttl=-1) is None
+    assert cache.get_or_set("missing", 60, lambda: ["vault"]) == ["vault"]
+
+
+def test_http_cache_serves_fresh_entries(tmp_path: Path, server_url: str):
+    cache = HTTPCache(tmp_path)
+
+    assert cache.get(f"{server_url}/v1", ttl=60).json() == {"tag_name": "/v1"}
+    assert cache.get(f"{server_url}/v1", ttl=60).json() == {"tag_name": "/v1"}
+    assert ReleaseHandler.requests == [""]
+
+
+def test_http_cache_revalidates_stale_entries(tmp_path: Path, server_url: str):
+    cache = HTTPCache(tmp_path)
+
+    cache.get(f"{server_url}/v1", ttl=0)
+    res = cache.get(f"{server_url}/v1", ttl=0)
+
+    assert res.json() == {"tag_name": "/v1"}
+    assert ReleaseHandler.requests == ["", ETAG]
+
+
+def test_http_cache_evicts_least_recently_used(tmp_path: Path, server_url: str):
+    cache = HTTPCache(tmp_path)
+    cache.get(f"{server_url}/v1", ttl=60)
+    for path in tmp_path.iterdir():
+        os.utime(path, (0, 0))
+
+    entry_size = sum(path.stat().st_size for path in tmp_path.iterdir())
+    cache._max_size = entry_size * 3 // 2
+    cache.get(f"{server_url}/v2", ttl=60)
+    cache.get(f"{server_url}/v1", ttl=60)
+
+    assert ReleaseHandler.requests == ["", "", ""]
+
+
+def test_artifact_store_links_and_evicts(tmp_path: Path):
+    store = ArtifactStore(tmp_path / "store")
+    for name in ("old", "new"):
+        (tmp_path / name).write_bytes(name.encode() * 100)
+        store.add(f"https://example.com/{name}", tmp_path / name)
+    os.utime(tmp_path / "old", (0, 0))
+
+    assert store.link("https://example.com/new", tmp_path / "linked")
+    assert (tmp_path / "linked").read_bytes() == b"new" * 100
+
+    store.prune(max_size=300)
+    assert store.get("https://example.com/old") is None
+    assert [artifact.url for artifact in store.list_artifacts()] == ["https://example.com/new"]
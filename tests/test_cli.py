@@ -1,19 +1,32 @@
+from io import StringIO
+from threading import Barrier
+
 import pytest
+from rich.console import Console
+from typer import Exit
 
-from mercado.cli import get_status, install_tool, uninstall_tool
+from mercado import cli
+from mercado.cli import cache_warm, get_status, install_tool, list_tools, manager, uninstall_tool
 from mercado.tool_manager import ToolManager
 
 
+def live_if_scripted(vendor: str, *values: str):
+    """Shell tools are installed by scripts that download from the real hosts"""
+    return pytest.param(*values, marks=pytest.mark.live if vendor == "Shell" else ())
+
+
 @pytest.mark.parametrize(
     "vendor,tool",
-    [(vendor, tools[0].name) for vendor, tools in ToolManager().get_supported_tools()],
+    [live_if_scripted(vendor, vendor, tools[0].name) for vendor, tools in ToolManager().get_supported_tools()],
 )
 def test_download_invalid_version(vendor: str, tool: str, os: str, arch: str):
     with pytest.raises(BaseException):
         install_tool(names=[f"{tool}@invalid"], os=os, arch=arch, dry_run=False)
 
 
-@pytest.mark.parametrize("tool", [t.name for _, tools in ToolManager().get_supported_tools() for t in tools])
+@pytest.mark.parametrize(
+    "tool", [live_if_scripted(vendor, t.name) for vendor, tools in ToolManager().get_supported_tools() for t in tools]
+)
 def test_download_verify_latest_uninstall(tool: str, os: str, arch: str):
     install_tool(names=[tool], os=os, arch=arch, dry_run=False)
     get_status(tool)
@@ -23,3 +36,80 @@ def test_download_verify_latest_uninstall(tool: str, os: str, arch: str):
         pytest.xfail("Docker cannot be uninstalled at the moment.")
 
     uninstall_tool(names=[tool], dry_run=False)
+
+
+def test_cache_warm_skips_tools_that_cannot_be_cached(monkeypatch: pytest.MonkeyPatch, os: str, arch: str):
+    def get_installer(name: str, *args):
+        raise AssertionError(f"The version of '{name}' was resolved")
+
+    monkeypatch.setattr(manager, "get_installer", get_installer)
+    assert not manager.supports_cache("helm")
+    cache_warm(names=["helm"], os=os, arch=arch)
+
+
+@pytest.fixture
+def installed(os: str, arch: str):
+    install_tool(names=["kind", "k9s"], os=os, arch=arch, dry_run=False)
+    yield ["kind", "k9s"]
+    uninstall_tool(names=["kind", "k9s"], dry_run=False)
+
+
+def test_list_verbose_probes_tools_concurrently(installed: list[str], monkeypatch: pytest.MonkeyPatch):
+    # The statuses only get past the barrier when both tools are probed at the same time
+    barrier = Barrier(len(installed), timeout=5)
+    get_tool_status = manager.get_status
+
+    def get_status(name: str):
+        barrier.wait()
+        return get_tool_status(name)
+
+    output = StringIO()
+    monkeypatch.setattr(manager, "get_status", get_status)
+    monkeypatch.setattr(cli, "console", Console(file=output, width=200))
+    monkeypatch.setattr(cli, "is_tool_available", lambda tool: tool.name in installed)
+
+    list_tools(filter_labels=None, verbose=True, names_only=False, with_labels=False, show_all=False, jobs=4)
+
+    rows = {line.split("│")[1].strip(): line for line in output.getvalue().splitlines() if line.count("│") > 2}
+    assert "0.21.0" in rows["kind"] and "0.31.8" in rows["k9s"]
+
+
+def test_list_verbose_reports_tools_that_could_not_be_checked(installed: list[str], monkeypatch: pytest.MonkeyPatch):
+    get_tool_status = manager.get_status
+
+    def get_status(name: str):
+        if name == "kind":
+            raise ValueError("rate limited")
+        return get_tool_status(name)
+
+    output = StringIO()
+    monkeypatch.setattr(manager, "get_status", get_status)
+    monkeypatch.setattr(cli, "console", Console(file=output, width=200))
+    monkeypatch.setattr(cli, "is_tool_available", lambda tool: tool.name in installed)
+
+    with pytest.raises(Exit):
+        list_tools(filter_labels=None, verbose=True, names_only=False, with_labels=False, show_all=False, jobs=4)
+
+    # The failure of one tool doesn't stop the others from being listed
+    rows = {line.split("│")[1].strip(): line for line in output.getvalue().splitlines() if line.count("│") > 2}
+    assert "🚫" in rows["kind"] and "0.31.8" in rows["k9s"]
+
+
+def test_install_jobs_installs_tools_concurrently(os: str, arch: str, monkeypatch: pytest.MonkeyPatch):
+    barrier = Barrier(2, timeout=5)
+    install = cli.install
+
+    def install_concurrently(name: str, *args):
+        if not name.startswith("invalid"):
+            barrier.wait()
+        install(name, *args)
+
+    monkeypatch.setattr(cli, "install", install_concurrently)
+
+    # A tool that fails doesn't stop the others, it is reported once they are done
+    with pytest.raises(Exit):
+        install_tool(names=["kind", "invalid", "k9s"], os=os, arch=arch, dry_run=False, jobs=3)
+    try:
+        assert manager.is_tool_available("kind") and manager.is_tool_available("k9s")
+    finally:
+        uninstall_tool(names=["kind", "k9s"], dry_run=False)
@@ -0,0 +1,188 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+
+import pytest
+from urllib3.exceptions import ProtocolError
+
+from mercado import download
+from mercado.cache import ArtifactStore
+from mercado.utils import get_session_stats
+
+ARTIFACT = os.urandom(1024 * 1024)
+DIGEST = sha256(ARTIFACT).hexdigest()
+ETAG = '"artifact"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves ARTIFACT with Range support, and drops the connection halfway through when asked to"""
+
+    protocol_version = "HTTP/1.1"
+    interrupt = False
+    delay = 0.0
+    ranges: list[str] = []
+
+    def do_GET(self):  # noqa: N802
+        start, end = 0, len(ARTIFACT)
+        RangeHandler.ranges.append(self.headers.get("Range", ""))
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range") == ETAG:
+            start, end = int(match[1]), int(match[2] or end - 1) + 1
+            self.send_response(HTTPStatus.PARTIAL_CONTENT.value)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(ARTIFACT)}")
+        else:
+            self.send_response(HTTPStatus.OK.value)
+
+        self.send_header("ETag", ETAG)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        time.sleep(RangeHandler.delay)
+
+        try:
+            if RangeHandler.interrupt:
+                RangeHandler.interrupt = False
+                self.wfile.write(ARTIFACT[start : (start + end) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(ARTIFACT[start:end])
+        except ConnectionError:
+            # The first response of a segmented download is closed once its range was read
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def artifact_url():
+    RangeHandler.ranges = []
+    RangeHandler.delay = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/artifact.bin"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def downloads_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(download, "DOWNLOADS_DIR", tmp_path / "downloads")
+    monkeypatch.setattr(download, "RESUME_BACKOFF_FACTOR", 0)
+    (tmp_path / "downloads").mkdir()
+    return tmp_path / "downloads"
+
+
+def test_download_resumes_after_interruption(tmp_path: Path, artifact_url: str):
+    RangeHandler.interrupt = True
+
+    digest = download.download_resumable("artifact", artifact_url, tmp_path / "artifact.bin", lambda *_: None)
+
+    assert (tmp_path / "artifact.bin").read_bytes() == ARTIFACT
+    assert digest == DIGEST
+    first, resumed = RangeHandler.ranges
+    assert not first
+    assert 0 < int(re.match(r"bytes=(\d+)-", resumed)[1]) <= len(ARTIFACT) // 2
+
+
+def test_download_resumes_partial_file_of_previous_run(tmp_path: Path, artifact_url: str, downloads_dir: Path):
+    RangeHandler.interrupt = True
+    download.RESUME_ATTEMPTS, attempts = 1, download.RESUME_ATTEMPTS
+    try:
+        with pytest.raises(ProtocolError):
+            download.download_resumable("artifact", artifact_url, tmp_path / "artifact.bin", lambda *_: None)
+    finally:
+        download.RESUME_ATTEMPTS = attempts
+
+    download.download_resumable("artifact", artifact_url, tmp_path / "artifact.bin", lambda *_: None)
+
+    assert (tmp_path / "artifact.bin").read_bytes() == ARTIFACT
+    assert list(downloads_dir.iterdir()) == []
+
+
+def test_segmented_download(tmp_path: Path, artifact_url: str, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(download, "SEGMENTED_DOWNLOAD_THRESHOLD", 0)
+    monkeypatch.setattr(download, "DOWNLOAD_CONNECTIONS", 4)
+
+    digest = download.download_resumable("artifact", artifact_url, tmp_path / "artifact.bin", lambda *_: None)
+
+    assert (tmp_path / "artifact.bin").read_bytes() == ARTIFACT
+    assert digest == DIGEST
+    segment = len(ARTIFACT) // 4
+    assert sorted(RangeHandler.ranges) == ["", *(f"bytes={i * segment}-{(i + 1) * segment - 1}" for i in range(1, 4))]
+
+
+def test_download_verifies_checksum(tmp_path: Path, artifact_url: str, monkeypatch: pytest.MonkeyPatch):
+    store = ArtifactStore(tmp_path / "artifacts")
+    monkeypatch.setattr(download, "artifact_store", store)
+
+    with pytest.raises(ValueError, match="checksum"):
+        download.download_url("artifact", artifact_url, tmp_path / "artifact", checksum="0" * 64)
+    assert not (tmp_path / "artifact").exists()
+    assert store.get(artifact_url) is None
+
+    download.download_url("artifact", artifact_url, tmp_path / "artifact", checksum=DIGEST)
+    assert (tmp_path / "artifact").read_bytes() == ARTIFACT
+    assert store.get(artifact_url).digest == DIGEST
+
+
+def test_session_stats_count_transferred_bytes(tmp_path: Path, artifact_url: str):
+    download.download_resumable("artifact", artifact_url, tmp_path / "artifact.bin", lambda *_: None)
+
+    host = artifact_url.removesuffix("/artifact.bin")
+    requests, connections, transferred = get_session_stats()[host]
+    assert requests >= 1 and connections >= 1
+    assert transferred >= len(ARTIFACT)
+
+
+def test_concurrent_downloads_of_the_same_url(tmp_path: Path, artifact_url: str, downloads_dir: Path):
+    RangeHandler.delay = 0.2
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        digests = list(
+            executor.map(
+                lambda dest: download.download_resumable("artifact", artifact_url, dest, lambda *_: None),
+                [tmp_path / "first.bin", tmp_path / "second.bin"],
+            )
+        )
+
+    assert digests == [DIGEST, DIGEST]
+    assert (tmp_path / "first.bin").read_bytes() == (tmp_path / "second.bin").read_bytes() == ARTIFACT
+    assert list(downloads_dir.iterdir()) == []
+
+
+def test_concurrent_installs_of_the_same_url_download_once(
+    tmp_path: Path, artifact_url: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(download, "artifact_store", ArtifactStore(tmp_path / "artifacts"))
+    RangeHandler.delay = 0.2
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for future in [
+            executor.submit(download.download_url, "artifact", artifact_url, tmp_path / name, checksum=DIGEST)
+            for name in ("first", "second")
+        ]:
+            future.result()
+
+    # The second install waited for the first one and linked the artifact it stored
+    assert RangeHandler.ranges == [""]
+    assert (tmp_path / "first").read_bytes() == (tmp_path / "second").read_bytes() == ARTIFACT
+
+
+def test_segmented_download_is_hashed_while_downloading(
+    tmp_path: Path, artifact_url: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(download, "SEGMENTED_DOWNLOAD_THRESHOLD", 0)
+    monkeypatch.setattr(download, "MAX_CHUNK_SIZE", 64 * 1024)
+
+    def hash_file(path: Path):
+        raise AssertionError(f"{path} was read again")
+
+    monkeypatch.setattr(download, "hash_file", hash_file)
+
+    assert download.download_resumable("artifact", artifact_url, tmp_path / "artifact.bin", lambda *_: None) == DIGEST
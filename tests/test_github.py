@@ -1,8 +1,161 @@
+import math
+import time
+from http import HTTPStatus
+
 import pytest
+from requests import Response
+from requests.structures import CaseInsensitiveDict
 
-from mercado.vendors.github import GitHub, GitHubTool
+from benchmarks.fake_server import FakeServer
+from mercado.vendors import github as github_module
+from mercado.vendors.github import RATE_LIMIT_MAX_WAIT, RATE_LIMIT_RESERVE, GitHub, GitHubTool, RateLimiter
 
 
 def test_get_latest_release_invalid_tool(github: GitHub):
     with pytest.raises(ValueError):
         github._get_latest_release(GitHubTool("invalid", repository="invalid"))
+
+
+def response(status: int = 200, **headers) -> Response:
+    res = Response()
+    res.status_code = status
+    res.headers = CaseInsensitiveDict({key.replace("_", "-"): str(value) for key, value in headers.items()})
+    return res
+
+
+def budget(remaining: int, reset: float, status: int = 200) -> Response:
+    headers = {"X-RateLimit-Limit": 60, "X-RateLimit-Remaining": remaining, "X-RateLimit-Reset": reset}
+    return response(status, **headers)
+
+
+def test_rate_limiter_reserves_budget():
+    limiter = RateLimiter()
+    assert not limiter.acquire("core")
+
+    limiter.update("core", budget(RATE_LIMIT_RESERVE, time.time() + 600), reserved=False)
+    assert limiter.acquire("core")
+    assert limiter.is_low("core")
+    assert limiter.cache_ttl("core", 60) == math.inf
+    assert limiter.cache_ttl("graphql", 60) == 60
+
+    # A cached response doesn't spend the reserved request
+    limiter.update("core", response(), reserved=True)
+    assert limiter.report()[0].startswith(f"GitHub core API: {RATE_LIMIT_RESERVE}/60 requests left")
+
+
+def test_rate_limiter_waits_for_reset(monkeypatch: pytest.MonkeyPatch):
+    sleeps = []
+    monkeypatch.setattr(github_module.time, "sleep", sleeps.append)
+    limiter = RateLimiter()
+
+    assert limiter.update("core", budget(0, time.time() + 30, HTTPStatus.FORBIDDEN.value), reserved=False)
+    assert not limiter.acquire("core")
+    assert 0 < sleeps[0] <= 30
+
+    limiter.update("core", budget(0, time.time() + RATE_LIMIT_MAX_WAIT + 60), reserved=False)
+    with pytest.raises(ValueError):
+        limiter.acquire("core")
+
+
+def test_rate_limiter_secondary_limit(monkeypatch: pytest.MonkeyPatch):
+    sleeps = []
+    monkeypatch.setattr(github_module.time, "sleep", sleeps.append)
+    limiter = RateLimiter()
+
+    assert limiter.update("core", response(HTTPStatus.FORBIDDEN.value, Retry_After=5), reserved=False)
+    assert not limiter.update("core", response(HTTPStatus.FORBIDDEN.value), reserved=False)
+    limiter.acquire("core")
+    assert 0 < sleeps[0] <= 5
+
+
+@pytest.fixture
+def latest_versions(monkeypatch: pytest.MonkeyPatch, github: GitHub) -> list[list[str]]:
+    """The batches of repositories queried with GraphQL, the latest versions are resolved again by every test"""
+    monkeypatch.setattr(github_module, "_latest_versions", {})
+    batches = []
+    get_latest_tags = github._get_latest_tags
+
+    def spy(repositories: list[str]) -> dict[str, str]:
+        batches.append(repositories)
+        return get_latest_tags(repositories)
+
+    monkeypatch.setattr(github, "_get_latest_tags", spy)
+    return batches
+
+
+@pytest.fixture
+def rest_lookups(monkeypatch: pytest.MonkeyPatch, github: GitHub) -> list[str]:
+    repositories = []
+    get_latest_release = github._get_latest_release
+
+    def spy(tool: GitHubTool) -> dict:
+        repositories.append(tool.repository)
+        return get_latest_release(tool)
+
+    monkeypatch.setattr(github, "_get_latest_release", spy)
+    return repositories
+
+
+TOOLS = [
+    GitHubTool("gh", repository="cli/cli"),
+    GitHubTool("kind", repository="kubernetes-sigs/kind"),
+    GitHubTool("k9s", repository="derailed/k9s"),
+]
+LATEST = {"cli/cli": "v2.40.1", "kubernetes-sigs/kind": "v0.21.0", "derailed/k9s": "v0.31.8"}
+
+
+def test_latest_versions_batched(
+    github: GitHub, latest_versions: list[list[str]], rest_lookups: list[str], monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(github, "_token", "token")
+
+    github.prefetch_latest_versions(TOOLS)
+
+    assert {tool.repository: github.get_latest_version(tool) for tool in TOOLS} == LATEST
+    assert latest_versions == [sorted(LATEST)]
+    assert rest_lookups == []
+
+
+def test_latest_versions_batches_are_split(
+    github: GitHub, latest_versions: list[list[str]], rest_lookups: list[str], monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(github, "_token", "token")
+    monkeypatch.setattr(github_module, "GRAPHQL_BATCH_SIZE", 2)
+
+    github.prefetch_latest_versions(TOOLS)
+
+    assert {tool.repository: github.get_latest_version(tool) for tool in TOOLS} == LATEST
+    assert latest_versions == [sorted(LATEST)[:2], sorted(LATEST)[2:]]
+    assert rest_lookups == []
+
+
+def test_latest_versions_fall_back_to_rest_on_graphql_error(
+    github: GitHub,
+    latest_versions: list[list[str]],
+    rest_lookups: list[str],
+    fake_server: FakeServer,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(github, "_token", "token")
+    monkeypatch.setattr(fake_server, "_github_graphql", lambda request: (HTTPStatus.BAD_GATEWAY.value, {}, b""))
+
+    github.prefetch_latest_versions(TOOLS)
+
+    # The prefetch leaves the repositories of the failed batch to their own lookups
+    assert latest_versions == [sorted(LATEST)]
+    assert rest_lookups == []
+    assert {tool.repository: github.get_latest_version(tool) for tool in TOOLS} == LATEST
+    assert sorted(rest_lookups) == sorted(LATEST)
+
+
+def test_latest_versions_without_token_are_not_prefetched(
+    github: GitHub, latest_versions: list[list[str]], rest_lookups: list[str], monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(github, "_token", None)
+
+    github.prefetch_latest_versions(TOOLS)
+
+    # Anonymous lookups are left to the concurrent per-tool lookups of the callers
+    assert latest_versions == []
+    assert rest_lookups == []
+    assert {tool.repository: github.get_latest_version(tool) for tool in TOOLS} == LATEST
@@ -1,9 +1,47 @@
+from pathlib import Path
+from typing import Callable
+
 import pytest
 
+from benchmarks.fake_server import FakeServer
+from mercado.cache import HTTPCache
+from mercado.vendors import hashicorp as hashicorp_module
 from mercado.vendors.hashicorp import Hashicorp
 from mercado.vendors.vendor import Tool
 
+RELEASES_API = "api.releases.hashicorp.com/v1/releases"
+
 
 def test_get_latest_release_invalid_tool(hashicorp: Hashicorp):
     with pytest.raises(ValueError):
         hashicorp._get_hashicorp_latest_release(Tool("invalid"))
+
+
+@pytest.fixture
+def releases_api(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, fake_server: FakeServer) -> Callable[[], list[str]]:
+    """The requests sent to the releases API from now on, the releases are never served from the HTTP cache"""
+    monkeypatch.setattr(hashicorp_module, "http_cache", HTTPCache(tmp_path))
+    start = len(fake_server.log)
+    return lambda: [url for _, url in fake_server.log[start:] if url.startswith(RELEASES_API)]
+
+
+def test_latest_version_requests_a_single_release(hashicorp: Hashicorp, releases_api: Callable[[], list[str]]):
+    assert hashicorp.get_latest_version(Tool("terraform")) == "1.7.4"
+    assert releases_api() == [f"{RELEASES_API}/terraform?license_class=oss&limit=1"]
+
+
+def test_installer_reuses_the_builds_of_fetched_releases(
+    hashicorp: Hashicorp, releases_api: Callable[[], list[str]], os: str, arch: str
+):
+    tool = Tool("terraform")
+    version = hashicorp.get_latest_version(tool)
+    installer = hashicorp.get_installer(tool, version, os, arch)
+
+    assert installer.version == version
+    assert len(releases_api()) == 1
+
+    # The releases of a versions page are indexed as well
+    versions, cursor = hashicorp.get_versions_page(tool)
+    assert "limit=20" in releases_api()[-1] and not cursor
+    hashicorp.get_installer(tool, versions[-1], os, arch)
+    assert len(releases_api()) == 2
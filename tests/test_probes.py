@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pytest
+
+from mercado import probes
+from mercado.cache import DiskCache
+from mercado.probes import get_tool_version
+
+SCRIPT = """#!/bin/sh
+echo "$@" >> {log}
+if [ "$1" = "version" ]; then echo "tool v{version}"; else echo "unknown flag: $1"; exit 1; fi
+"""
+
+
+@pytest.fixture(autouse=True)
+def disk_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(probes, "disk_cache", DiskCache(tmp_path / "cache"))
+
+
+def write_tool(tmp_path: Path, version: str) -> Path:
+    path = tmp_path / "tool"
+    path.write_text(SCRIPT.format(log=tmp_path / "calls.log", version=version))
+    path.chmod(0o755)
+    return path
+
+
+def calls(tmp_path: Path) -> list[str]:
+    calls = (tmp_path / "calls.log").read_text().splitlines()
+    (tmp_path / "calls.log").unlink()
+    return calls
+
+
+def test_version_probe_is_learned_and_cached(tmp_path: Path):
+    path = write_tool(tmp_path, "1.2.3")
+
+    assert get_tool_version(path) == "1.2.3"
+    assert calls(tmp_path) == ["--version", "version"]
+
+    assert get_tool_version(path) == "1.2.3"
+    assert not (tmp_path / "calls.log").exists()
+
+    path = write_tool(tmp_path, "1.2.40")
+    assert get_tool_version(path) == "1.2.40"
+    assert calls(tmp_path) == ["version"]
+
+
+def test_declared_version_probe(tmp_path: Path):
+    path = write_tool(tmp_path, "1.2.3")
+
+    assert get_tool_version(path, ("version", "--client")) == "1.2.3"
+    assert calls(tmp_path) == ["version --client"]
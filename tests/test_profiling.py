@@ -0,0 +1,56 @@
+import pstats
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from mercado.profiling import ProfileMode, Profiler, import_times, parse_import_times
+
+
+def allocate(size: int) -> bytes:
+    return bytes(size)
+
+
+def test_profile_threads_and_memory(tmp_path: Path):
+    profiler = Profiler(ProfileMode.ALL, tmp_path / "profiles", "test")
+    profiler.start()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        chunks = list(executor.map(allocate, [1024 * 1024] * 4))
+    profiler.stop()
+
+    # The calls of the worker threads are merged into the stats of the command
+    assert ("allocate", 4) in [(name.partition("(")[2][:-1], calls) for name, calls, *_ in profiler.top_functions(100)]
+    assert pstats.Stats(str(profiler.profile_path)).total_calls > 0
+
+    snapshot = tracemalloc.Snapshot.load(str(profiler.snapshot_path))
+    assert sum(stat.size for stat in snapshot.statistics("filename")) >= len(chunks) * 1024 * 1024
+    (line, size, count), *_ = profiler.top_allocations()
+    assert line.endswith(f"test_profiling.py:{allocate.__code__.co_firstlineno + 1}") and count == 4
+    assert profiler.peak_memory >= size
+
+
+def test_profile_cpu_only(tmp_path: Path):
+    profiler = Profiler(ProfileMode.CPU, tmp_path, "test")
+    profiler.start()
+    allocate(1)
+    profiler.stop()
+
+    assert profiler.profile_path.exists() and not profiler.snapshot_path.exists()
+    assert profiler.top_allocations() == []
+    assert not tracemalloc.is_tracing()
+
+
+def test_parse_import_times():
+    lines = [
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |       rich.style",
+        "import time:       300 |        400 |     rich.console",
+        "import time:       200 |        600 |   rich",
+        "import time:       250 |        250 |   humanize",
+        "unrelated output",
+    ]
+    assert parse_import_times(lines) == [("rich", 3, 0.0006), ("humanize", 1, 0.00025)]
+
+
+def test_import_times():
+    packages = {package for package, *_ in import_times()}
+    assert {"mercado", "rich", "requests", "typer", "humanize"} <= packages
@@ -1,6 +1,9 @@
 import pytest
 
-from mercado.tool_manager import ToolManager
+from mercado.tool_manager import ToolManager, parse_tool_spec
+from mercado.vendors.github import GitHub
+from mercado.vendors.hashicorp import Hashicorp
+from mercado.vendors.vendor import Label, Tool
 
 
 def test_get_installer_invalid_tool(toolmanager: ToolManager, os: str, arch: str):
@@ -12,3 +15,52 @@ def test_get_installer_invalid_tool(toolmanager: ToolManager, os: str, arch: str
 def test_get_installer_happy_flow(toolmanager: ToolManager, tool: str, os: str, arch: str):
     installer = toolmanager.get_installer(tool, os, arch)
     assert toolmanager.get_installer(f"{tool}@{installer.version}", os, arch) == installer
+
+
+def test_get_tool_by_alias(toolmanager: ToolManager):
+    assert toolmanager.get_tool("docker-compose") == toolmanager.get_tool("compose")
+    assert toolmanager.get_tool("compose@v2.23.0").name == "compose"
+
+
+def test_get_tools_by_labels(toolmanager: ToolManager):
+    tools = toolmanager.get_tools([Label.K8S, Label.DOCKER])
+
+    assert [tool.name for tool in tools] == sorted(tool.name for tool in tools)
+    assert {tool.name for tool in tools} == {
+        tool.name for tool in toolmanager.get_tools() if {Label.K8S, Label.DOCKER} & set(tool.labels)
+    }
+
+
+def test_duplicate_tool_names():
+    with pytest.raises(ValueError):
+        ToolManager({GitHub: [Tool("tool")], Hashicorp: [Tool("other", aliases=("tool",))]})
+
+
+@pytest.mark.parametrize("spec,name,version", [("gh", "gh", ""), ("gh@v2.40.1", "gh", "v2.40.1")])
+def test_parse_tool_spec(spec: str, name: str, version: str):
+    assert parse_tool_spec(spec) == (name, version)
+
+
+def test_get_statuses_records_failures(toolmanager: ToolManager, monkeypatch: pytest.MonkeyPatch):
+    def get_status(name: str):
+        if name == "kind":
+            raise ValueError("rate limited")
+        return True, False, "1.0.0", None, "2.0.0"
+
+    monkeypatch.setattr(toolmanager, "get_status", get_status)
+
+    statuses, failures = toolmanager.get_statuses(["gh", "kind", "k9s"], jobs=3)
+    assert list(statuses) == ["gh", "k9s"]
+    assert list(failures) == ["kind"] and str(failures["kind"]) == "rate limited"
+
+
+def test_resolve_version_of_vendor_without_versions(toolmanager: ToolManager):
+    # aws is installed by a script and versioned by a page that only holds the latest version
+    assert not toolmanager._get_tool("aws")[0].supports_versions
+    with pytest.raises(ValueError, match="does not support version constraints"):
+        toolmanager.resolve_version("aws", "~2.15")
+
+
+def test_resolve_version_of_tool_versioned_by_github(toolmanager: ToolManager):
+    # kubectl is downloaded from a URL and versioned by the releases of its GitHub repository
+    assert toolmanager.resolve_version("kubectl", "~1.28") == "v1.28.7"
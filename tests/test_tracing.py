@@ -0,0 +1,58 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from mercado import tracing
+from mercado.tracing import Tracer, disable_tracing, enable_tracing, span, traced
+
+
+@pytest.fixture
+def tracer() -> Tracer:
+    yield enable_tracing()
+    disable_tracing()
+
+
+@traced("test.double")
+def double(value: int) -> int:
+    return value * 2
+
+
+def test_spans_are_not_recorded_when_disabled():
+    assert tracing._tracer is None
+
+    with span("test.block"):
+        assert double(2) == 4
+    assert enable_tracing().spans == []
+    disable_tracing()
+
+
+def test_nested_spans(tracer: Tracer):
+    with span("test.outer", tool="tool"):
+        double(1)
+        double(2)
+
+    inner, _, outer = tracer.spans
+    assert [span.name for span in tracer.spans] == ["test.double", "test.double", "test.outer"]
+    assert outer.args == {"tool": "tool"}
+    assert outer.start_ns <= inner.start_ns and inner.duration_ns <= outer.duration_ns
+
+    (name, calls, *_), _ = sorted(tracer.summary())
+    assert (name, calls) == ("test.double", 2)
+
+
+def test_concurrent_spans_chrome_trace(tracer: Tracer, tmp_path: Path):
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="worker") as executor:
+        assert list(executor.map(double, range(8))) == [value * 2 for value in range(8)]
+
+    path = tmp_path / "trace.json"
+    tracer.write_chrome_trace(path)
+
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    threads = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert len(spans) == 8
+    assert all(span["cat"] == "test" and span["dur"] >= 0 for span in spans)
+    assert {span["tid"] for span in spans} == threads.keys()
+    assert all(name.startswith("worker") for name in threads.values())
@@ -0,0 +1,109 @@
+from pathlib import Path
+from threading import Barrier, Lock
+
+import pytest
+from requests import ConnectionError
+
+from benchmarks.fake_server import FakeServer
+from mercado.cache import DiskCache
+from mercado.vendors import url_fetcher
+from mercado.vendors.url_fetcher import URLFetcher, URLFetcherTool
+
+HOST = "storage.googleapis.com"
+VERSION = "v1.29.2"
+
+
+def kubectl_url(os: str, arch: str, version: str) -> str:
+    return f"https://{HOST}/kubernetes-release/release/{version}/bin/{os}/{arch}/kubectl"
+
+
+@pytest.fixture(autouse=True)
+def variations(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> DiskCache:
+    cache = DiskCache(tmp_path)
+    monkeypatch.setattr(url_fetcher, "disk_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def probed(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    urls = []
+    is_url_available = URLFetcher._is_url_available
+
+    def probe(self, url: str) -> bool:
+        urls.append(url)
+        return is_url_available(self, url)
+
+    monkeypatch.setattr(URLFetcher, "_is_url_available", probe)
+    return urls
+
+
+def test_check_urls_probes_variations_concurrently(
+    fake_server: FakeServer, probed: list[str], monkeypatch: pytest.MonkeyPatch
+):
+    tool = URLFetcherTool("kubectl")
+    # The probes only get past the barrier once all the variations of the architecture are probed at the same time
+    barrier = Barrier(3, timeout=5)
+    probe = URLFetcher._is_url_available
+
+    def is_url_available(self, url: str) -> bool:
+        barrier.wait()
+        return probe(self, url)
+
+    monkeypatch.setattr(URLFetcher, "_is_url_available", is_url_available)
+
+    requests = fake_server.requests[HOST]
+    url = URLFetcher()._check_urls(tool, "linux", "x86_64", VERSION, kubectl_url)
+    assert url == kubectl_url("linux", "amd64", VERSION)
+    assert sorted(probed) == sorted(kubectl_url("linux", arch, VERSION) for arch in ("amd64", "x86_64", "64bit"))
+    # The probes that lost were waited for, none of them lands after the lookup returned
+    assert fake_server.requests[HOST] == requests + 3
+
+    # The variation that was valid is remembered and probed alone
+    monkeypatch.setattr(URLFetcher, "_is_url_available", probe)
+    probed.clear()
+    requests = fake_server.requests[HOST]
+    assert URLFetcher()._check_urls(tool, "linux", "x86_64", VERSION, kubectl_url) == url
+    assert probed == [url]
+    assert fake_server.requests[HOST] == requests + 1
+
+
+def test_check_urls_probes_at_most_max_workers(fake_server: FakeServer, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(url_fetcher, "MAX_WORKERS", 2)
+    lock = Lock()
+    in_flight, most = 0, 0
+    probe = URLFetcher._is_url_available
+
+    def is_url_available(self, url: str) -> bool:
+        nonlocal in_flight, most
+        with lock:
+            in_flight += 1
+            most = max(most, in_flight)
+        try:
+            return probe(self, url)
+        finally:
+            with lock:
+                in_flight -= 1
+
+    monkeypatch.setattr(URLFetcher, "_is_url_available", is_url_available)
+
+    # The six variations of macOS on x86_64 are probed two at a time, and none is left in flight on return
+    URLFetcher()._check_urls(URLFetcherTool("kubectl"), "darwin", "x86_64", VERSION, kubectl_url)
+    assert in_flight == 0 and 0 < most <= 2
+
+
+def test_check_urls_tolerates_failing_candidates(probed: list[str], monkeypatch: pytest.MonkeyPatch):
+    probe = URLFetcher._is_url_available
+
+    def is_url_available(self, url: str) -> bool:
+        if "/amd64/" not in url:
+            raise ConnectionError(f"{url} is unreachable")
+        return probe(self, url)
+
+    monkeypatch.setattr(URLFetcher, "_is_url_available", is_url_available)
+    tool = URLFetcherTool("kubectl")
+
+    assert URLFetcher()._check_urls(tool, "linux", "x86_64", VERSION, kubectl_url) == kubectl_url(
+        "linux", "amd64", VERSION
+    )
+    with pytest.raises(ValueError, match="URL is not valid"):
+        URLFetcher()._check_urls(tool, "linux", "arm64", VERSION, kubectl_url)
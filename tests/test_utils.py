@@ -0,0 +1,163 @@
+import io
+import os
+import tarfile
+from pathlib import Path
+from zipfile import ZipFile
+
+import pytest
+
+from mercado import utils
+from mercado.utils import (
+    PathIndex,
+    clone_file,
+    extract_file_from_archive,
+    extract_file_from_tar_stream,
+    install_file,
+    install_symlink,
+    parse_checksum,
+)
+
+MEMBERS = {"tool-1.0/README.md": b"docs", "tool-1.0/bin/tool": b"binary", "tool-1.0/completions/tool.bash": b"bash"}
+
+
+def write_tar(path: Path, mode: str):
+    with tarfile.open(path, mode) as archive:
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("suffix,mode", [(".tar.gz", "w:gz"), (".tar.xz", "w:xz"), (".tar", "w")])
+def test_extract_file_from_tar(tmp_path: Path, suffix: str, mode: str):
+    archive = tmp_path / f"tool{suffix}"
+    write_tar(archive, mode)
+
+    binary = extract_file_from_archive(archive, "tool")
+
+    assert binary.read_bytes() == b"binary"
+    assert [path.name for path in binary.parent.iterdir()] == ["tool"]
+
+
+def test_extract_file_from_zip(tmp_path: Path):
+    archive = tmp_path / "tool.zip"
+    with ZipFile(archive, "w") as zip_file:
+        for name, data in MEMBERS.items():
+            zip_file.writestr(name, data)
+
+    assert extract_file_from_archive(archive, "tool").read_bytes() == b"binary"
+
+
+def test_extract_file_from_tar_stream_missing_member(tmp_path: Path):
+    archive = tmp_path / "tool.tar.gz"
+    write_tar(archive, "w:gz")
+
+    with pytest.raises(ValueError), archive.open("rb") as file:
+        extract_file_from_tar_stream(file, "missing", tmp_path / "missing")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        f"{'a' * 64}  tool_linux_amd64.tar.gz\n{'b' * 64}  tool_darwin_arm64.tar.gz\n",
+        f"{'b' * 64} *tool_darwin_arm64.tar.gz\n",
+        f"{'b' * 64}  ./dist/tool_darwin_arm64.tar.gz\n",
+        f"{'B' * 64}\n",
+    ],
+)
+def test_parse_checksum(text: str):
+    assert parse_checksum(text, "tool_darwin_arm64.tar.gz") == "b" * 64
+
+
+def test_parse_checksum_of_missing_file():
+    with pytest.raises(ValueError):
+        parse_checksum(f"{'a' * 64}  tool_linux_amd64.tar.gz\n", "tool_darwin_arm64.tar.gz")
+
+
+def test_install_file_replaces_running_binary(tmp_path: Path):
+    dest = tmp_path / "tool"
+    dest.write_bytes(b"old")
+    (tmp_path / "new").write_bytes(b"new")
+
+    with dest.open("rb") as running:
+        install_file(tmp_path / "new", dest)
+        assert running.read() == b"old"
+
+    assert dest.read_bytes() == b"new"
+    assert os.access(dest, os.X_OK)
+    assert not (tmp_path / "new").exists()
+    assert [path.name for path in tmp_path.iterdir()] == ["tool"]
+
+
+def test_install_file_copies_linked_file(tmp_path: Path):
+    (tmp_path / "blob").write_bytes(b"new")
+    os.link(tmp_path / "blob", tmp_path / "new")
+
+    install_file(tmp_path / "new", tmp_path / "tool")
+
+    assert (tmp_path / "tool").read_bytes() == b"new"
+    assert (tmp_path / "tool").stat().st_ino != (tmp_path / "blob").stat().st_ino
+    assert not os.access(tmp_path / "blob", os.X_OK)
+
+
+def test_install_symlink(tmp_path: Path):
+    (tmp_path / "tool").write_bytes(b"old")
+
+    install_symlink(tmp_path / "packages" / "tool", tmp_path / "tool")
+
+    assert (tmp_path / "tool").readlink() == tmp_path / "packages" / "tool"
+
+
+def test_clone_file(tmp_path: Path):
+    data = os.urandom(1024 * 1024 + 1)
+    (tmp_path / "src").write_bytes(data)
+
+    clone_file(tmp_path / "src", tmp_path / "dest")
+
+    assert (tmp_path / "dest").read_bytes() == data
+
+
+def test_clone_file_without_ficlone(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # Platforms other than Linux never send the FICLONE ioctl
+    def ioctl(*args):
+        raise AssertionError("FICLONE was requested")
+
+    monkeypatch.setattr(utils, "FICLONE", None)
+    monkeypatch.setattr(utils.fcntl, "ioctl", ioctl)
+    (tmp_path / "src").write_bytes(b"binary")
+
+    clone_file(tmp_path / "src", tmp_path / "dest")
+
+    assert (tmp_path / "dest").read_bytes() == b"binary"
+
+
+def test_path_index(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    first, second = tmp_path / "first", tmp_path / "second"
+    for directory in (first, second):
+        directory.mkdir()
+        (directory / "tool").touch(mode=0o755)
+    (first / "tool").chmod(0o644)
+    monkeypatch.setenv("PATH", f"{first}{os.pathsep}{tmp_path / 'missing'}{os.pathsep}{second}")
+    index = PathIndex()
+
+    assert index.which("tool") == second / "tool"
+    assert index.which("other") is None
+
+    (first / "other").touch(mode=0o755)
+    index.invalidate(first)
+    assert index.which("other") == first / "other"
+
+    monkeypatch.setattr(utils, "PATH_INDEX_INTERVAL", 0)
+    (second / "another").touch(mode=0o755)
+    assert index.which("another") == second / "another"
+
+
+def test_path_index_skips_entries_that_are_not_directories(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "file").touch()
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "tool").touch(mode=0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'file'}{os.pathsep}{tmp_path / 'bin'}")
+    index = PathIndex()
+
+    assert index.which("tool") == tmp_path / "bin" / "tool"
+    assert index.find(tmp_path / "file", "tool") is None
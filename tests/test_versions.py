@@ -0,0 +1,111 @@
+from pathlib import Path
+
+import pytest
+
+from mercado import versions
+from mercado.cache import DiskCache
+from mercado.versions import (
+    ReleaseIndex,
+    is_outdated,
+    is_version_constraint,
+    parse_version,
+    parse_version_constraint,
+)
+
+
+@pytest.mark.parametrize(
+    "lower,higher",
+    [
+        ("1.2.3", "v1.2.4"),
+        ("1.9.0", "1.10.0"),
+        ("1.29", "1.29.1"),
+        ("2.0.0-rc.1", "2.0.0"),
+        ("2.0.0-alpha", "2.0.0-alpha.1"),
+        ("2.0.0-alpha.1", "2.0.0-beta"),
+        ("2.0.0-rc.2", "2.0.0-rc.10"),
+    ],
+)
+def test_version_precedence(lower: str, higher: str):
+    assert parse_version(lower) < parse_version(higher)
+    assert is_outdated(lower, higher)
+    assert not is_outdated(higher, lower)
+
+
+def test_version_equality():
+    assert parse_version("v1.2.0+build.5") == parse_version("1.2")
+    assert not is_outdated("1.6.0", "v1.6.0")
+
+
+def test_invalid_version():
+    with pytest.raises(ValueError):
+        parse_version("latest")
+    assert is_outdated("abc", "def")
+    assert not is_outdated("abc", "vabc")
+
+
+@pytest.mark.parametrize(
+    "constraint,version",
+    [
+        ("~1.5", "v1.5.7"),
+        ("~>1.5.2", "v1.5.7"),
+        ("~>1.5", "1.6.0"),
+        ("^0.20", "0.20.3"),
+        (">=0.20,<0.22", "0.21.1"),
+        (">=2.0.0-rc.1", "2.0.0-rc.2"),
+        ("!=1.6.0,>1.5.7", ""),
+        (">=3", ""),
+    ],
+)
+def test_version_constraint(constraint: str, version: str):
+    tags = ["2.0.0-rc.2", "1.6.0", "1.6.0-rc.1", "v1.5.7", "0.21.1", "0.20.3", "latest", "0.9.1"]
+
+    assert is_version_constraint(constraint)
+    assert parse_version_constraint(constraint).best(tags) == version
+
+
+@pytest.fixture
+def releases(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    monkeypatch.setattr(versions, "disk_cache", DiskCache(tmp_path))
+    return [f"1.{minor}.{patch}" for minor in range(9, -1, -1) for patch in range(4, -1, -1)]
+
+
+def fetch_pages(releases: list[str], pages: list[str]):
+    def fetch_page(cursor: str) -> tuple[list[str], str]:
+        pages.append(cursor)
+        start = int(cursor or 0)
+        return releases[start : start + 10], str(start + 10) if start + 10 < len(releases) else ""
+
+    return fetch_page
+
+
+def test_release_index_fetches_older_pages_until_satisfied(releases: list[str]):
+    pages = []
+    index = ReleaseIndex("tool", fetch_pages(releases, pages))
+
+    assert index.resolve(parse_version_constraint("~1.6")) == "1.6.4"
+    assert pages == ["", "10"]
+
+    pages.clear()
+    assert index.resolve(parse_version_constraint("~1.7")) == "1.7.4"
+    assert pages == []
+
+
+def test_release_index_refreshes_incrementally(releases: list[str], monkeypatch: pytest.MonkeyPatch):
+    pages = []
+    ReleaseIndex("tool", fetch_pages(releases, pages)).resolve(parse_version_constraint("~1.9"))
+    monkeypatch.setattr(versions, "RELEASE_INDEX_TTL", -1)
+
+    pages.clear()
+    index = ReleaseIndex("tool", fetch_pages(["1.10.0", *releases], pages))
+
+    assert index.resolve(parse_version_constraint(">=1.9")) == "1.10.0"
+    assert index.resolve(parse_version_constraint("~1.8")) == "1.8.4"
+    assert pages == ["", ""]
+
+
+def test_release_index_stops_below_lower_bound(releases: list[str]):
+    pages = []
+
+    with pytest.raises(ValueError):
+        ReleaseIndex("tool", fetch_pages(releases, pages)).resolve(parse_version_constraint(">=2.0"))
+    assert pages == [""]